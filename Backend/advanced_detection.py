@@ -1,44 +1,135 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import torch
 from datetime import datetime
 import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from model_wrapper import load_engine, ENGINE_BATCH
+
+# COCO class ids: person, and car/motorcycle/bus/truck
+PERSON_CLASSES = (0,)
+VEHICLE_CLASSES = (2, 3, 5, 7)
+DETECTION_CLASSES = list(PERSON_CLASSES + VEHICLE_CLASSES)
+
+# Score cut-offs separating LOW | MEDIUM | HIGH | CRITICAL
+THREAT_THRESHOLDS = np.array([15, 30, 50])
+THREAT_LABELS = np.array(['LOW', 'MEDIUM', 'HIGH', 'CRITICAL'])
+
+# Frames arriving within this window (seconds) share one forward pass
+BATCH_WINDOW = 0.005
 
 class AdvancedThreatDetector:
     def __init__(self):
+        # Persons and vehicles share one engine; they differ only in the classes= filter
+        self._yolo = load_engine('yolov8n.pt', batch=ENGINE_BATCH)
         self.models = {
-            'person': YOLO('yolov8n.pt'),
-            'vehicle': YOLO('yolov8n.pt'),
+            'person': self._yolo,
+            'vehicle': self._yolo,
             'weapon': None,  # Custom weapon detection model
             'face': None     # Face recognition model
         }
         self.threat_zones = []
         self.behavior_analyzer = BehaviorAnalyzer()
+        self._frame_queue = asyncio.Queue()
+        self._batch_task = None
+        # Forward passes run here, one at a time, so the event loop keeps serving during inference
+        self._infer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="threat-infer")
         
-    async def multi_class_detection(self, image):
-        """Detect multiple threat categories"""
-        results = {
-            'persons': [],
-            'vehicles': [],
-            'weapons': [],
-            'faces': [],
-            'threat_level': 'LOW'
-        }
-        
-        # Person detection
-        person_results = self.models['person'](image, classes=[0])
-        # Vehicle detection  
-        vehicle_results = self.models['person'](image, classes=[2, 3, 5, 7])
-        
-        # Analyze threat level
-        threat_level = self.calculate_threat_level(results)
-        results['threat_level'] = threat_level
-        
-        return results
-    
+    async def detect(self, image):
+        """Queue a single frame for the next batched forward pass"""
+        if self._batch_task is None or self._batch_task.done():
+            self._batch_task = asyncio.create_task(self._collect_batches(), name="threat-batcher")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._frame_queue.put((image, future))
+        return await future
+
+    async def _collect_batches(self):
+        """Group frames arriving within BATCH_WINDOW into one model call"""
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self._frame_queue.get()]
+            deadline = loop.time() + BATCH_WINDOW
+
+            while len(pending) < ENGINE_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self._frame_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                reports = await self.multi_class_detection([frame for frame, _ in pending])
+            except Exception as e:
+                print(f"❌ Batched detection error: {e}")
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), report in zip(pending, reports):
+                if not future.done():
+                    future.set_result(report)
+
+    async def multi_class_detection(self, images):
+        """Detect multiple threat categories in one frame or a batch of frames"""
+        single = not isinstance(images, (list, tuple))
+        frames = [images] if single else list(images)
+
+        # One forward pass for persons and vehicles, split by class afterwards
+        loop = asyncio.get_running_loop()
+        batch_results = []
+        for start in range(0, len(frames), ENGINE_BATCH):
+            batch = frames[start:start + ENGINE_BATCH]
+            batch_results.extend(await loop.run_in_executor(
+                self._infer_pool, lambda batch=batch: self._yolo(batch, classes=DETECTION_CLASSES, verbose=False)
+            ))
+
+        reports = []
+        for result in batch_results:
+            results = {
+                'persons': [],
+                'vehicles': [],
+                'weapons': [],
+                'faces': [],
+                'threat_level': 'LOW'
+            }
+
+            boxes = result.boxes
+            if boxes is not None and len(boxes) > 0:
+                xyxy = boxes.xyxy.cpu().numpy().tolist()
+                confidences = boxes.conf.cpu().numpy().tolist()
+                class_ids = boxes.cls.cpu().numpy().astype(int).tolist()
+
+                for box, confidence, class_id in zip(xyxy, confidences, class_ids):
+                    target = {'box': box, 'confidence': confidence, 'class_id': class_id}
+                    if class_id in PERSON_CLASSES:
+                        results['persons'].append(target)
+                    else:
+                        results['vehicles'].append(target)
+
+            reports.append(results)
+
+        # Analyze threat level for the whole batch in one pass
+        scores = np.array([self.calculate_threat_score(results) for results in reports])
+        for results, threat_level in zip(reports, self.classify_threat_scores(scores).tolist()):
+            results['threat_level'] = threat_level
+
+        return reports[0] if single else reports
+
     def calculate_threat_level(self, detections):
         """AI-based threat assessment"""
+        return str(self.classify_threat_scores(self.calculate_threat_score(detections)))
+
+    def classify_threat_scores(self, scores):
+        """Map a score or an array of scores to threat labels without branching"""
+        return THREAT_LABELS[np.searchsorted(THREAT_THRESHOLDS, scores, side='right')]
+
+    def calculate_threat_score(self, detections):
+        """Additive threat score for one frame's detections"""
         score = 0
         
         # Multiple persons = higher threat
@@ -55,14 +146,7 @@ class AdvancedThreatDetector:
         if detections['vehicles']:
             score += 20
             
-        if score >= 50:
-            return 'CRITICAL'
-        elif score >= 30:
-            return 'HIGH'
-        elif score >= 15:
-            return 'MEDIUM'
-        else:
-            return 'LOW'
+        return score
 
 class BehaviorAnalyzer:
     def __init__(self):
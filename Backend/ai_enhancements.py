@@ -1,8 +1,13 @@
+import itertools
+import time
+from datetime import datetime
+
 class AIEnhancements:
     def __init__(self):
         self.face_recognition = FaceRecognitionSystem()
         self.behavior_ai = BehaviorAI()
         self.predictive_ai = PredictiveAnalytics()
+        self._incident_seq = itertools.count()
         
     async def facial_recognition(self, image):
         """Identify known persons/suspects"""
@@ -39,8 +44,9 @@ class AIEnhancements:
     
     async def automated_incident_report(self, detection_data):
         """AI-generated incident reports"""
+        # Millisecond clock + sequence in hex: unique per process and no strftime
         report = {
-            'incident_id': f"INC-{datetime.now().strftime('%Y%m%d-%H%M%S')}",
+            'incident_id': f"INC-{int(time.time() * 1000):x}{next(self._incident_seq):x}",
             'summary': self.generate_summary(detection_data),
             'recommendations': self.generate_recommendations(detection_data),
             'evidence': detection_data.get('image_path'),
@@ -1,8 +1,54 @@
-import smtplib
-import requests
+import aiohttp
+import aiosmtplib
 from twilio.rest import Client
 import asyncio
+import hashlib
+import os
+import time
 from datetime import datetime
+from email.message import EmailMessage
+
+# Alert delivery settings; a channel whose settings are missing is skipped
+SMTP_HOST = os.getenv("ALERT_SMTP_HOST")
+SMTP_PORT = os.getenv("ALERT_SMTP_PORT")
+SMTP_USE_TLS = os.getenv("ALERT_SMTP_USE_TLS") == "1"  # implicit TLS; otherwise STARTTLS when offered
+SMTP_USERNAME = os.getenv("ALERT_SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("ALERT_SMTP_PASSWORD")
+ALERT_EMAIL_FROM = os.getenv("ALERT_EMAIL_FROM")
+ALERT_EMAIL_TO = os.getenv("ALERT_EMAIL_TO")
+ALERT_WEBHOOK_URL = os.getenv("ALERT_WEBHOOK_URL")
+
+class RecentAlertFilter:
+    """Rolling Bloom filter of recent alert fingerprints"""
+    def __init__(self, size_bits=1 << 16, num_hashes=7, rotate_after=3600):
+        self.size_bits = size_bits
+        self.num_hashes = num_hashes
+        self.rotate_after = rotate_after
+        self._bits = bytearray(size_bits // 8)
+        self._created = time.monotonic()
+        
+    def _positions(self, key):
+        """Bit positions for key via double hashing over one blake2b digest"""
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size_bits for i in range(self.num_hashes)]
+        
+    def check_and_add(self, key):
+        """Record key and report whether it was (probably) already present"""
+        # Start a fresh filter every rotate_after seconds so memory and false positives stay bounded
+        now = time.monotonic()
+        if now - self._created > self.rotate_after:
+            self._bits = bytearray(len(self._bits))
+            self._created = now
+            
+        seen = True
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                seen = False
+                self._bits[byte] |= 1 << bit
+        return seen
 
 class SmartAlertSystem:
     def __init__(self):
@@ -13,6 +59,12 @@ class SmartAlertSystem:
             'webhook': True,
             'mobile_push': True
         }
+        self._recent_alerts = RecentAlertFilter()
+        
+        # Long-lived clients so repeat alerts reuse TCP/TLS sessions
+        self._http = None
+        self._smtp = None
+        self._smtp_lock = asyncio.Lock()
         
     async def process_threat_alert(self, detection_data):
         """Intelligent alert processing"""
@@ -25,7 +77,10 @@ class SmartAlertSystem:
     def should_send_alert(self, data):
         """AI-based alert filtering"""
         # Time-based filtering
-        # Duplicate detection suppression
+        # Duplicate detection suppression: one alert per level/location/minute
+        key = f"{data.get('threat_level')}|{data.get('location')}|{int(time.time() // 60)}"
+        if self._recent_alerts.check_and_add(key):
+            return False
         # Confidence threshold
         # Location-based rules
         return True
@@ -45,6 +100,54 @@ class SmartAlertSystem:
         # Webhook for integrations
         await self.send_webhook_alert(data)
         
+    async def _get_http(self):
+        """Shared HTTP session, created on first use inside the running loop"""
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5))
+        return self._http
+        
+    async def _get_smtp(self):
+        """Shared SMTP connection, (re)opened on demand; caller holds _smtp_lock"""
+        if self._smtp is None or not self._smtp.is_connected:
+            self._smtp = aiosmtplib.SMTP(hostname=SMTP_HOST, port=int(SMTP_PORT) if SMTP_PORT else None,
+                                         use_tls=SMTP_USE_TLS)
+            await self._smtp.connect()
+            if SMTP_USERNAME:
+                await self._smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
+        return self._smtp
+        
+    async def send_email_alert(self, alert_message):
+        """Email the formatted alert over the pooled SMTP connection"""
+        if not (SMTP_HOST and ALERT_EMAIL_FROM and ALERT_EMAIL_TO):
+            return
+        
+        message = EmailMessage()
+        message['From'] = ALERT_EMAIL_FROM
+        message['To'] = ALERT_EMAIL_TO
+        message['Subject'] = "🚨 Guard-X Threat Alert"
+        message.set_content(alert_message)
+        
+        # One socket, so sends are serialized
+        async with self._smtp_lock:
+            smtp = await self._get_smtp()
+            await smtp.send_message(message)
+            
+    async def send_webhook_alert(self, data):
+        """POST the raw alert to the integration webhook"""
+        if not ALERT_WEBHOOK_URL:
+            return
+        
+        http = await self._get_http()
+        async with http.post(ALERT_WEBHOOK_URL, json=data) as response:
+            response.raise_for_status()
+            
+    async def close(self):
+        """Close pooled HTTP and SMTP connections"""
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+        if self._smtp is not None and self._smtp.is_connected:
+            await self._smtp.quit()
+        
     def format_alert_message(self, data):
         """Format professional alert message"""
         return f"""
@@ -52,7 +155,7 @@ class SmartAlertSystem:
         
         Level: {data['threat_level']}
         Location: {data.get('location', 'Unknown')}
-        Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        Time: {datetime.now().isoformat(sep=' ', timespec='seconds')}
         Confidence: {data.get('confidence', 0):.2f}%
         
         Details: {data.get('description', 'No additional details')}
@@ -1,54 +1,187 @@
-import pandas as pd
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from plotly.offline import get_plotlyjs
+from datetime import datetime, timedelta, timezone
 import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+# Static page that renders a figure from inlined JSON, built once at import. plotly.js from the
+# installed package is inlined (as fig.to_html() did) so the dashboard works offline and matches its version
+_HTML_SHELL = (Path(__file__).parent / 'templates' / 'plotly_shell.html').read_text()
+_HTML_HEAD, _HTML_TAIL = _HTML_SHELL.replace('%%PLOTLY_JS%%', get_plotlyjs()).split('%%FIG_JSON%%')
+
+DETECTIONS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS detections (
+        id INTEGER PRIMARY KEY,
+        timestamp INTEGER,
+        location TEXT,
+        threat_type TEXT,
+        confidence REAL,
+        operator TEXT,
+        resolved BOOLEAN
+    )
+'''
+
+def _iso_to_unix(value):
+    """Legacy ISO timestamp (naive means local time) as unix seconds; None if it doesn't parse"""
+    if value is None:
+        return None
+    try:
+        return int(datetime.fromisoformat(str(value)).timestamp())
+    except ValueError:
+        return None
 
 class AnalyticsEngine:
     def __init__(self):
         self.db_path = "surveillance_analytics.db"
+        # Dashboard query results keyed by (name, *args, epoch) -> (expires_at, value)
+        self._cache: dict[tuple, tuple[float, Any]] = {}
+        self._cache_epoch = 0
+        
+        # One long-lived autocommit connection; WAL lets reads run alongside writes
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute("PRAGMA mmap_size=268435456")
+        self._conn.execute("PRAGMA cache_size=-65536")
+        self._write_lock = threading.Lock()
         self.init_database()
         
+    def _cached(self, key: tuple, ttl: float, fn: Callable[[], Any]) -> Any:
+        """Return a cached result for key, recomputing it once ttl has passed"""
+        key = key + (self._cache_epoch,)
+        now = time.monotonic()
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        
+        value = fn()
+        self._cache[key] = (now + ttl, value)
+        return value
+    
+    def record_detection(self, location, threat_type, confidence, operator, resolved=False):
+        """Store a detection and invalidate cached dashboard results"""
+        with self._write_lock:
+            self._conn.execute('''
+                INSERT INTO detections (timestamp, location, threat_type, confidence, operator, resolved)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (int(time.time()), location, threat_type, confidence, operator, resolved))
+            
+            # Entries from older epochs are unreachable; drop them
+            self._cache_epoch += 1
+            self._cache.clear()
+        
     def init_database(self):
         """Initialize analytics database"""
-        conn = sqlite3.connect(self.db_path)
+        with self._write_lock:
+            self._create_schema(self._conn)
+    
+    def _create_schema(self, conn):
+        # Timestamps are unix seconds so day buckets are an integer divide, not a string parse
+        conn.execute(DETECTIONS_SCHEMA)
+        self._migrate_timestamps(conn)
+        
+        # Daily rollup kept current by a trigger so trends never scan detections
         conn.execute('''
-            CREATE TABLE IF NOT EXISTS detections (
-                id INTEGER PRIMARY KEY,
-                timestamp DATETIME,
-                location TEXT,
-                threat_type TEXT,
-                confidence REAL,
-                operator TEXT,
-                resolved BOOLEAN
+            CREATE TABLE IF NOT EXISTS daily_detections (
+                day INTEGER PRIMARY KEY,
+                incidents INTEGER NOT NULL DEFAULT 0,
+                sum_conf REAL NOT NULL DEFAULT 0,
+                cnt_conf INTEGER NOT NULL DEFAULT 0
             )
         ''')
-        conn.close()
+        # Recreated on every start so existing databases pick up changes to its definition.
+        # A NULL timestamp has no day; inserting NULL into an INTEGER PRIMARY KEY would mint a bogus rowid bucket
+        conn.execute("DROP TRIGGER IF EXISTS detections_daily_rollup")
+        conn.execute('''
+            CREATE TRIGGER detections_daily_rollup
+            AFTER INSERT ON detections
+            WHEN NEW.timestamp IS NOT NULL
+            BEGIN
+                INSERT INTO daily_detections (day, incidents, sum_conf, cnt_conf)
+                VALUES (NEW.timestamp / 86400, 1, COALESCE(NEW.confidence, 0), NEW.confidence IS NOT NULL)
+                ON CONFLICT(day) DO UPDATE SET
+                    incidents = incidents + 1,
+                    sum_conf = sum_conf + COALESCE(NEW.confidence, 0),
+                    cnt_conf = cnt_conf + (NEW.confidence IS NOT NULL);
+            END
+        ''')
+        
+        # Backfill the rollup once for databases created before it existed
+        if conn.execute("SELECT COUNT(*) FROM daily_detections").fetchone()[0] == 0:
+            conn.execute('''
+                INSERT INTO daily_detections (day, incidents, sum_conf, cnt_conf)
+                SELECT timestamp / 86400, COUNT(*), COALESCE(SUM(confidence), 0), COUNT(confidence)
+                FROM detections
+                WHERE timestamp IS NOT NULL
+                GROUP BY timestamp / 86400
+            ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_det_ts ON detections(timestamp)")
+    
+    def _migrate_timestamps(self, conn):
+        """One-time rewrite of ISO-string timestamps into INTEGER unix seconds"""
+        columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(detections)")}
+        if columns.get('timestamp', '').upper() == 'INTEGER':
+            return
+        
+        print("🔄 Migrating detections.timestamp to unix seconds...")
+        # Converted in Python: the legacy strings are naive local times, which strftime('%s') would read as UTC
+        conn.create_function('iso_to_unix', 1, _iso_to_unix, deterministic=True)
+        conn.execute("BEGIN")
+        try:
+            # The rollup is derived data; it is rebuilt from the migrated rows
+            conn.execute("DROP TRIGGER IF EXISTS detections_daily_rollup")
+            conn.execute("DROP TABLE IF EXISTS daily_detections")
+            conn.execute("ALTER TABLE detections RENAME TO detections_legacy")
+            conn.execute(DETECTIONS_SCHEMA)
+            conn.execute('''
+                INSERT INTO detections (id, timestamp, location, threat_type, confidence, operator, resolved)
+                SELECT id, iso_to_unix(timestamp),
+                       location, threat_type, confidence, operator, resolved
+                FROM detections_legacy
+            ''')
+            conn.execute("DROP TABLE detections_legacy")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
     
     def generate_threat_trends(self, days=30):
         """Generate threat trend analysis"""
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query(f'''
-            SELECT DATE(timestamp) as date, 
-                   COUNT(*) as incidents,
-                   AVG(confidence) as avg_confidence
-            FROM detections 
-            WHERE timestamp >= datetime('now', '-{days} days')
-            GROUP BY DATE(timestamp)
-        ''', conn)
+        return self._cached(("trends", days), 60, lambda: self._build_threat_trends(days))
+    
+    def _build_threat_trends(self, days):
+        rows = self._conn.execute('''
+            SELECT day, incidents, sum_conf / NULLIF(cnt_conf, 0) AS avg_confidence
+            FROM daily_detections
+            WHERE day >= (CAST(strftime('%s', 'now') AS INTEGER) - ? * 86400) / 86400
+            ORDER BY day
+        ''', (int(days),)).fetchall()
+        
+        dates = [datetime.fromtimestamp(row[0] * 86400, tz=timezone.utc).date().isoformat() for row in rows]
+        incidents = [row[1] for row in rows]
         
         # Create interactive plot
         fig = go.Figure()
         fig.add_trace(go.Scatter(
-            x=df['date'],
-            y=df['incidents'],
+            x=dates,
+            y=incidents,
             mode='lines+markers',
             name='Daily Incidents'
         ))
         
-        return fig.to_html()
+        # Escape "</" so the inlined JSON cannot close the script tag
+        fig_json = fig.to_json(pretty=False, engine='orjson').replace('</', '<\\/')
+        return _HTML_HEAD + fig_json + _HTML_TAIL
     
     def get_performance_metrics(self):
         """System performance dashboard"""
+        return self._cached(("metrics",), 10, self._build_performance_metrics)
+    
+    def _build_performance_metrics(self):
         return {
             'total_detections': self.get_total_detections(),
             'accuracy_rate': self.calculate_accuracy(),
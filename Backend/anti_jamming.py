@@ -1,18 +1,74 @@
 import asyncio
 import time
+import os
+import re
+import itertools
 import numpy as np
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import psutil
-import socket
-import subprocess
-import json
+import orjson
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; kernels then run as plain Python
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+
+# Number of signal readings kept for pattern analysis
+HISTORY_SIZE = 100
+
+# Kernel wireless statistics, one line per interface after two header lines
+WIRELESS_STATS_PATH = '/proc/net/wireless'
+# "wlan0: 0000   54.  -56.  -256 ..." -> signal level of the first interface
+_SIGNAL_LEVEL_RE = re.compile(rb'^\s*[^\s:]+:\s+\S+\s+\S+\s+(-?\d+)', re.MULTILINE)
+
+# Seconds a psutil snapshot is reused across evidence records
+SYSTEM_STATE_TTL = 1.0
+
+# One JSON file per evidence record
+EVIDENCE_DIR = 'evidence'
+
+# No 'nnan' fast-math flag: the kernel relies on NaN checks to skip empty slots
+@njit(cache=True, fastmath={'reassoc', 'contract'})
+def _window_interference(buffer, start, count):
+    """Single-pass variance of a ring-buffer window scaled to 0..1, or -1.0 if it holds no readings"""
+    total = 0.0
+    total_sq = 0.0
+    valid = 0
+    for i in range(count):
+        value = buffer[(start + i) % buffer.size]
+        if value == value:
+            total += value
+            total_sq += value * value
+            valid += 1
+    
+    if valid == 0:
+        return -1.0
+    
+    mean = total / valid
+    variance = max(total_sq / valid - mean * mean, 0.0)
+    return min(variance / 100.0, 1.0)
+
+# Compile (or load the cached build) at import rather than on the first monitor tick
+_window_interference(np.zeros(HISTORY_SIZE, dtype=np.float32), 0, 10)
 
 class AntiJammingSystem:
     def __init__(self):
         self.is_monitoring = False
         self.jamming_detected = False
-        self.signal_strength_history = []
+        # Ring buffers of signal readings; _idx counts every reading ever written
+        self._ts = np.zeros(HISTORY_SIZE, dtype=np.float64)
+        self._wifi = np.full(HISTORY_SIZE, np.nan, dtype=np.float32)
+        self._cellular = np.full(HISTORY_SIZE, np.nan, dtype=np.float32)
+        self._idx = 0
+        self._wireless_stats = None  # kept open and re-read on every poll
+        self._system_state_cache = (0.0, None)  # (monotonic timestamp, snapshot)
+        
+        # Evidence files are written off the event loop by a single I/O thread
+        self._io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='jam-io')
+        self._evidence_seq = itertools.count()
         self.network_health = {}
         self.backup_channels = ['wifi', 'cellular', 'ethernet']
         self.current_channel = 'wifi'
@@ -29,11 +85,12 @@ class AntiJammingSystem:
         print("🛡️ Anti-jamming system activated")
         
         # Start monitoring tasks
+        loop = asyncio.get_running_loop()
         tasks = [
-            asyncio.create_task(self.monitor_signal_strength()),
-            asyncio.create_task(self.monitor_network_health()),
-            asyncio.create_task(self.monitor_interference()),
-            asyncio.create_task(self.monitor_gps_jamming())
+            loop.create_task(self.monitor_signal_strength(), name="jamming-signal-monitor"),
+            loop.create_task(self.monitor_network_health(), name="jamming-network-monitor"),
+            loop.create_task(self.monitor_interference(), name="jamming-interference-monitor"),
+            loop.create_task(self.monitor_gps_jamming(), name="jamming-gps-monitor")
         ]
         
         await asyncio.gather(*tasks)
@@ -43,26 +100,15 @@ class AntiJammingSystem:
         while self.is_monitoring:
             try:
                 # Get WiFi signal strength
-                wifi_strength = self.get_wifi_signal_strength()
+                wifi_strength = await self.get_wifi_signal_strength()
                 
                 # Get cellular signal (if available)
                 cellular_strength = self.get_cellular_signal_strength()
                 
-                current_time = time.time()
-                signal_data = {
-                    'timestamp': current_time,
-                    'wifi': wifi_strength,
-                    'cellular': cellular_strength
-                }
-                
-                self.signal_strength_history.append(signal_data)
-                
-                # Keep only last 100 readings
-                if len(self.signal_strength_history) > 100:
-                    self.signal_strength_history.pop(0)
+                self._record_signal(time.time(), wifi_strength, cellular_strength)
                 
                 # Detect sudden signal drops
-                if len(self.signal_strength_history) >= 5:
+                if self._idx >= 5:
                     await self.analyze_signal_patterns()
                 
                 await asyncio.sleep(2)  # Check every 2 seconds
@@ -71,28 +117,53 @@ class AntiJammingSystem:
                 print(f"❌ Signal monitoring error: {e}")
                 await asyncio.sleep(5)
     
-    def get_wifi_signal_strength(self):
+    def _record_signal(self, timestamp, wifi, cellular):
+        """Write one reading into the ring buffers, overwriting the oldest"""
+        slot = self._idx % HISTORY_SIZE
+        self._ts[slot] = timestamp
+        self._wifi[slot] = np.nan if wifi is None else wifi
+        self._cellular[slot] = np.nan if cellular is None else cellular
+        self._idx += 1
+    
+    def _recent(self, buffer, count, skip=0):
+        """Last count readings of buffer (oldest first), ending skip readings before the newest"""
+        end = self._idx - skip
+        return np.take(buffer, np.arange(end - count, end) % HISTORY_SIZE)
+    
+    def _signal_history(self, count):
+        """Last count readings as JSON-friendly dicts"""
+        count = min(count, self._idx)
+        timestamps = self._recent(self._ts, count).tolist()
+        wifi = self._recent(self._wifi, count).tolist()
+        cellular = self._recent(self._cellular, count).tolist()
+        return [
+            {
+                'timestamp': ts,
+                'wifi': None if np.isnan(w) else w,
+                'cellular': None if np.isnan(c) else c
+            }
+            for ts, w, c in zip(timestamps, wifi, cellular)
+        ]
+    
+    async def get_wifi_signal_strength(self):
         """Get current WiFi signal strength"""
         try:
-            # Linux/Mac command
-            result = subprocess.run(['iwconfig'], capture_output=True, text=True)
-            output = result.stdout
+            if self._wireless_stats is None:
+                self._wireless_stats = open(WIRELESS_STATS_PATH, 'rb')
+            self._wireless_stats.seek(0)
             
-            # Parse signal strength
-            if 'Signal level' in output:
-                signal_line = [line for line in output.split('\n') if 'Signal level' in line][0]
-                signal_strength = int(signal_line.split('Signal level=')[1].split(' ')[0])
-                return abs(signal_strength)  # Convert to positive value
+            # Parse signal strength straight from the raw bytes
+            match = _SIGNAL_LEVEL_RE.search(self._wireless_stats.read())
+            if match:
+                return abs(int(match.group(1)))  # Convert to positive value
             
             return -50  # Default moderate signal
             
         except Exception:
-            # Fallback: simulate signal strength based on network connectivity
-            try:
-                socket.create_connection(("8.8.8.8", 53), timeout=3)
+            # Fallback: simulate signal strength based on network connectivity (probed without blocking the loop)
+            if await self._probe_server('8.8.8.8') is not None:
                 return 45  # Good signal
-            except:
-                return 80  # Poor signal
+            return 80  # Poor signal
     
     def get_cellular_signal_strength(self):
         """Get cellular signal strength (if available)"""
@@ -109,34 +180,31 @@ class AntiJammingSystem:
             try:
                 # Test connectivity to multiple servers
                 test_servers = ['8.8.8.8', '1.1.1.1', '208.67.222.222']
-                connectivity_results = []
                 
-                for server in test_servers:
-                    start_time = time.time()
-                    try:
-                        socket.create_connection((server, 53), timeout=3)
-                        response_time = (time.time() - start_time) * 1000
-                        connectivity_results.append({
-                            'server': server,
-                            'connected': True,
-                            'response_time': response_time
-                        })
-                    except:
-                        connectivity_results.append({
-                            'server': server,
-                            'connected': False,
-                            'response_time': None
-                        })
+                # Probe all servers concurrently; a tick costs the slowest probe, not the sum
+                rtts = await asyncio.gather(*[self._probe_server(server) for server in test_servers])
+                
+                # Response times in ms; NaN marks a server that did not answer
+                response_times = np.full(len(test_servers), np.nan)
+                connectivity_results = []
+                for i, (server, rtt) in enumerate(zip(test_servers, rtts)):
+                    if rtt is not None:
+                        response_times[i] = rtt * 1000
+                    connectivity_results.append({
+                        'server': server,
+                        'connected': rtt is not None,
+                        'response_time': rtt * 1000 if rtt is not None else None
+                    })
                 
                 # Calculate packet loss percentage
-                connected_count = sum(1 for result in connectivity_results if result['connected'])
+                connected_count = int(np.count_nonzero(~np.isnan(response_times)))
                 packet_loss = ((len(test_servers) - connected_count) / len(test_servers)) * 100
                 
                 self.network_health = {
                     'timestamp': time.time(),
                     'packet_loss': packet_loss,
                     'connectivity_results': connectivity_results,
-                    'avg_response_time': np.mean([r['response_time'] for r in connectivity_results if r['response_time']])
+                    'avg_response_time': float(np.nanmean(response_times)) if connected_count else 0.0
                 }
                 
                 # Detect network jamming
@@ -152,6 +220,19 @@ class AntiJammingSystem:
                 print(f"❌ Network monitoring error: {e}")
                 await asyncio.sleep(10)
     
+    async def _probe_server(self, server, port=53, timeout=3):
+        """Open a TCP connection to server; return the round-trip time in seconds or None"""
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(server, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        
+        rtt = loop.time() - start_time
+        writer.close()
+        return rtt
+    
     async def monitor_interference(self):
         """Monitor RF interference patterns"""
         while self.is_monitoring:
@@ -177,18 +258,15 @@ class AntiJammingSystem:
         # In real implementation, this would use SDR to analyze spectrum
         # For now, simulate based on signal strength variations
         
-        if len(self.signal_strength_history) < 10:
+        if self._idx < 10:
             return 0.1
         
-        recent_signals = [s['wifi'] for s in self.signal_strength_history[-10:] if s['wifi']]
-        if not recent_signals:
-            return 0.5
-        
         # Calculate signal variance (high variance = potential interference)
-        signal_variance = np.var(recent_signals)
-        interference_level = min(signal_variance / 100, 1.0)
+        interference_level = _window_interference(self._wifi, self._idx - 10, 10)
+        if interference_level < 0:
+            return 0.5
         
-        return interference_level
+        return float(interference_level)
     
     async def monitor_gps_jamming(self):
         """Monitor GPS jamming attempts"""
@@ -219,18 +297,20 @@ class AntiJammingSystem:
     
     async def analyze_signal_patterns(self):
         """Analyze signal patterns for jamming detection"""
-        if len(self.signal_strength_history) < 5:
+        if self._idx < 10:
             return
         
-        recent_signals = self.signal_strength_history[-5:]
-        older_signals = self.signal_strength_history[-10:-5] if len(self.signal_strength_history) >= 10 else []
+        recent_signals = self._recent(self._wifi, 5)
+        older_signals = self._recent(self._wifi, 5, skip=5)
         
-        if not older_signals:
+        if np.isnan(recent_signals).all() or np.isnan(older_signals).all():
             return
         
         # Calculate signal strength changes
-        recent_avg = np.mean([s['wifi'] for s in recent_signals if s['wifi']])
-        older_avg = np.mean([s['wifi'] for s in older_signals if s['wifi']])
+        recent_avg = float(np.nanmean(recent_signals))
+        older_avg = float(np.nanmean(older_signals))
+        if older_avg == 0:
+            return
         
         signal_drop_percent = ((older_avg - recent_avg) / older_avg) * 100
         
@@ -352,22 +432,32 @@ class AntiJammingSystem:
         """Store jamming evidence for analysis"""
         evidence = {
             'event': jamming_event,
-            'signal_history': self.signal_strength_history[-20:],  # Last 20 readings
+            'signal_history': self._signal_history(20),  # Last 20 readings
             'network_health': self.network_health,
-            'system_state': {
-                'cpu_usage': psutil.cpu_percent(),
-                'memory_usage': psutil.virtual_memory().percent,
-                'network_io': dict(psutil.net_io_counters()._asdict())
-            }
+            'system_state': self._get_system_state()
         }
         
-        # Save to file
-        filename = f"jamming_evidence_{int(time.time())}.json"
-        with open(f"evidence/{filename}", 'w') as f:
-            json.dump(evidence, f, indent=2)
+        # Save to file (the suffix keeps records from the same second apart)
+        filename = f"jamming_evidence_{int(time.time())}_{next(self._evidence_seq)}.json"
+        payload = orjson.dumps(evidence, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
         
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._io_pool, _write_evidence_file, filename, payload)
         print(f"📁 Evidence stored: {filename}")
     
+    def _get_system_state(self):
+        """CPU, memory and network counters, memoized for SYSTEM_STATE_TTL seconds"""
+        cached_at, snapshot = self._system_state_cache
+        now = time.monotonic()
+        if snapshot is None or now - cached_at > SYSTEM_STATE_TTL:
+            snapshot = {
+                'cpu_usage': psutil.cpu_percent(),
+                'memory_usage': psutil.virtual_memory().percent,
+                'network_io': psutil.net_io_counters()._asdict()
+            }
+            self._system_state_cache = (now, snapshot)
+        return snapshot
+    
     def register_alert_callback(self, callback):
         """Register callback for jamming alerts"""
         self.alert_callbacks.append(callback)
@@ -378,10 +468,16 @@ class AntiJammingSystem:
             'monitoring': self.is_monitoring,
             'jamming_detected': self.jamming_detected,
             'current_channel': self.current_channel,
-            'signal_strength': self.signal_strength_history[-1] if self.signal_strength_history else None,
+            'signal_strength': self._signal_history(1)[0] if self._idx else None,
             'network_health': self.network_health,
             'last_update': datetime.now().isoformat()
         }
 
+def _write_evidence_file(filename, payload):
+    """Blocking evidence write; runs on the jam-io thread"""
+    os.makedirs(EVIDENCE_DIR, exist_ok=True)
+    with open(os.path.join(EVIDENCE_DIR, filename), 'wb') as f:
+        f.write(payload)
+
 # Global anti-jamming system
 anti_jamming_system = AntiJammingSystem()
\ No newline at end of file
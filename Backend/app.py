@@ -1,13 +1,32 @@
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+from typing import Literal, Optional
 import uvicorn
 from datetime import datetime, timedelta
 from pathlib import Path
 import io
 from PIL import Image
+import numpy as np
+import torch
 import asyncio
+import time
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJPF_GRAY
+    _tj = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _tj = None  # libjpeg-turbo not available; Pillow decodes every upload
+
+try:
+    from torchvision.io import decode_jpeg, ImageReadMode
+    _GPU_DECODE = torch.cuda.is_available()
+except ImportError:
+    _GPU_DECODE = False
 
 # Import modules
 from model_wrapper import ModelWrapper
@@ -20,11 +39,19 @@ from camera_detection import router as camera_router
 from cache_manager import cache_manager
 from anti_jamming import anti_jamming_system
 from drone_management import drone_fleet
+from process_lock import claim_process_lock
+
+# Per-request tracing is debug-level; production runs at WARNING so the hot path never formats it
+# Root handler so guardx records below WARNING reach the console; other libraries keep the root's WARNING
+logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("guardx")
+logger.setLevel(os.getenv("GUARDX_LOG_LEVEL", "WARNING").upper())
 
 app = FastAPI(
     title="Guard-X Military Surveillance API",
     description="🎖️ CLASSIFIED - Army AI Surveillance System",
-    version="2.0.0-MILITARY"
+    version="2.0.0-MILITARY",
+    default_response_class=ORJSONResponse
 )
 
 # CORS Configuration
@@ -41,17 +68,143 @@ app.include_router(camera_router, prefix="/camera", tags=["camera"])
 
 # Initialize systems
 model_wrapper = ModelWrapper()
-initialize_army_auth_system()
+_init_task = None
+# Held by the one worker that runs the drone and anti-jamming monitors
+MONITOR_LOCK = os.path.join("logs", "monitors.lock")
+_OWNS_MONITORS = False
+
+UPLOAD_CHUNK = 1 << 20  # 1 MiB
+# libjpeg-turbo, nvJPEG and Pillow all release the GIL while decoding, so uploads decode in parallel
+DECODE_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="decode")
+# Serve near-duplicate frames (re-encoded, jittered) from cache by perceptual hash
+PERCEPTUAL_CACHE = os.getenv("PERCEPTUAL_CACHE", "1") == "1"
+# The custom model is deployed with the image, so one stat at import is enough
+_HAS_CUSTOM_MODEL = Path("models/best.pt").exists()
+# Threat assessment indexed by min(target count, 4)
+THREAT_LEVELS = ("LOW", "MEDIUM", "HIGH", "HIGH", "CRITICAL")
+CLOCK_TICK = 0.25  # seconds between refreshes of the cached response timestamp
+
+# Response timestamps only need coarse resolution; a background task keeps this current
+_NOW_ISO = datetime.now().isoformat()
+
+async def _refresh_clock():
+    """Keep the cached ISO timestamp within one tick of the wall clock"""
+    global _NOW_ISO
+    while True:
+        await asyncio.sleep(CLOCK_TICK)
+        _NOW_ISO = datetime.now().isoformat()
+
+async def _read_upload(file: UploadFile):
+    """Read an upload into a buffer allocated once from the known part size"""
+    if not file.size:
+        return await file.read()
+    
+    buffer = bytearray(file.size)
+    view = memoryview(buffer)
+    offset = 0
+    while chunk := await file.read(UPLOAD_CHUNK):
+        end = offset + len(chunk)
+        if end > len(buffer):
+            raise HTTPException(status_code=400, detail="UPLOAD SIZE MISMATCH")
+        view[offset:end] = chunk
+        offset = end
+    return view[:offset]
+
+def _decode_image(image_bytes):
+    """Decode an upload to a CHW uint8 CUDA tensor (nvJPEG) or an H x W x 3 RGB uint8 array"""
+    if _GPU_DECODE and image_bytes[:2] == b'\xff\xd8':
+        try:
+            # Huffman + IDCT + color convert on the GPU; pixels never touch host memory
+            data = torch.frombuffer(image_bytes, dtype=torch.uint8)
+            return decode_jpeg(data, mode=ImageReadMode.RGB, device='cuda')
+        except RuntimeError:
+            pass  # nvJPEG rejected the stream; decode on the CPU instead
+    
+    if _tj is not None:
+        try:
+            # SIMD IDCT and YCbCr->RGB in one pass, straight into an ndarray
+            return _tj.decode(image_bytes, pixel_format=TJPF_RGB)
+        except Exception:
+            pass  # not a JPEG, or one libjpeg-turbo rejects; fall back to Pillow
+    
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return np.asarray(image)
+
+def _perceptual_hash(image_bytes):
+    """64-bit dHash of a 1/8-scale JPEG decode, keyed with the full image dimensions"""
+    try:
+        width, height, _, _ = _tj.decode_header(image_bytes)
+        # At 1/8 scale libjpeg-turbo only needs the DC coefficient of each 8x8 block
+        preview = _tj.decode(image_bytes, pixel_format=TJPF_GRAY, scaling_factor=(1, 8))
+    except Exception:
+        return None  # not a JPEG
+    
+    preview = preview[:, :, 0]
+    rows, cols = preview.shape[0] // 8 * 8, preview.shape[1] // 9 * 9
+    if rows == 0 or cols == 0:
+        return None
+    grid = preview[:rows, :cols].reshape(8, rows // 8, 9, cols // 9).mean(axis=(1, 3))
+    bits = np.packbits(grid[:, 1:] > grid[:, :-1])
+    return f"p{width}x{height}-{bits.tobytes().hex()}"
+
+def _image_dimensions(image_bytes):
+    """Read (width, height) from the image header without decoding pixels"""
+    if _tj is not None:
+        try:
+            width, height, _, _ = _tj.decode_header(image_bytes)
+            return width, height
+        except Exception:
+            pass  # not a JPEG; let Pillow identify it
+    
+    try:
+        # Image.open only parses the header; pixel data is read lazily
+        return Image.open(io.BytesIO(image_bytes)).size
+    except Exception:
+        raise HTTPException(status_code=400, detail="INVALID IMAGE - UNREADABLE HEADER")
+
+async def _initialize_systems():
+    """Load models and bring up auth concurrently while the API already serves"""
+    await asyncio.gather(
+        model_wrapper.load_models(),
+        asyncio.to_thread(initialize_army_auth_system)
+    )
+    print("✅ GUARD-X SYSTEM OPERATIONAL")
+
+def _init_error() -> Optional[BaseException]:
+    """Exception that ended _init_task, if it finished unsuccessfully"""
+    if _init_task is None or not _init_task.done():
+        return None
+    if _init_task.cancelled():
+        return asyncio.CancelledError("initialization cancelled")
+    return _init_task.exception()
+
+def _report_init_failure(task):
+    """Log a failed initialization as soon as it happens (this also retrieves the exception)"""
+    error = _init_error()
+    if error is not None:
+        print(f"❌ GUARD-X INITIALIZATION FAILED: {error!r}")
 
 # Start drone monitoring on startup
 @app.on_event("startup")
 async def startup_event():
     """Initialize military systems on startup"""
+    global _init_task, _OWNS_MONITORS
     print("🎖️  GUARD-X MILITARY SYSTEM INITIALIZING...")
-    await model_wrapper.load_models()
-    print("✅ GUARD-X SYSTEM OPERATIONAL")
-    asyncio.create_task(drone_fleet.start_monitoring())
-    print("🚁 Drone fleet monitoring started")
+    # Not awaited: uvicorn starts accepting requests now and /api/health reports readiness
+    _init_task = asyncio.create_task(_initialize_systems())
+    _init_task.add_done_callback(_report_init_failure)
+    # Fleet state lives in one process: with several workers only the lock holder monitors it
+    _OWNS_MONITORS = claim_process_lock(MONITOR_LOCK)
+    if _OWNS_MONITORS:
+        asyncio.create_task(drone_fleet.start_monitoring())
+        print("🚁 Drone fleet monitoring started")
+    else:
+        print("🚁 Drone fleet monitoring runs in another worker")
+    asyncio.create_task(cache_manager.run_ttl_sweeper())
+    asyncio.create_task(_refresh_clock())
+    asyncio.create_task(_alert_consumer())
 
 # MILITARY AUTH ENDPOINTS
 @app.post("/api/auth/login", response_model=Token)
@@ -100,43 +253,71 @@ async def get_current_user_info(current_user = Depends(get_current_user)):
 async def military_threat_detection(
     file: UploadFile = File(...),
     confidence: float = 0.5,
+    compat: bool = False,
+    precision: Optional[Literal["fp32", "fp16", "int8"]] = None,
     current_user = Depends(require_clearance_level("SECRET"))
 ):
-    """🔒 CLASSIFIED - Military threat detection endpoint"""
+    """🔒 CLASSIFIED - Military threat detection endpoint (?compat=1 adds the legacy flat keys)"""
     try:
-        print(f"🔄 DETECTION REQUEST from {current_user['username']}")
-        print(f"📁 File: {file.filename}, Type: {file.content_type}")
+        logger.debug("🔄 DETECTION REQUEST from %s, file %s (%s)",
+                     current_user['username'], file.filename, file.content_type)
         
         # Validate file type
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="INVALID FILE TYPE - IMAGE REQUIRED")
         
         # Read and process image
-        image_bytes = await file.read()
-        print(f"📊 Image size: {len(image_bytes)} bytes")
-        
-        image = Image.open(io.BytesIO(image_bytes))
-        print(f"🖼️  Image dimensions: {image.width}x{image.height}, Mode: {image.mode}")
+        image_bytes = await _read_upload(file)
+        logger.debug("📊 Image size: %d bytes", len(image_bytes))
         
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-            print("🔄 Converted image to RGB")
+        # A repeated upload is answered from cache without decoding a single pixel
+        precision = model_wrapper.resolve_precision(precision)
+        image_hash = cache_manager.content_key(image_bytes, precision)
+        detection_result = cache_manager.get_detection(image_hash, confidence, count_miss=False)
+        if detection_result is None:
+            # Another worker may already have computed it
+            detection_result = await cache_manager.get_shared_detection(image_hash, confidence)
         
-        # Run military-grade detection
-        print("🤖 Running AI detection...")
-        detection_result = await model_wrapper.detect_humans(image, confidence)
-        print(f"✅ Detection complete: {detection_result}")
+        if detection_result is not None:
+            # Dimensions were stored with the result when it was first computed
+            width = detection_result["image_size"]["width"]
+            height = detection_result["image_size"]["height"]
+        else:
+            if not model_wrapper.models:
+                raise HTTPException(status_code=503, detail="MODELS LOADING - RETRY SHORTLY")
+            
+            # Header peek only: rejects corrupt uploads before spending a decode on them
+            width, height = _image_dimensions(image_bytes)
+            logger.debug("🖼️  Image dimensions: %dx%d", width, height)
+            
+            loop = asyncio.get_running_loop()
+            perceptual_hash = None
+            if PERCEPTUAL_CACHE and _tj is not None:
+                perceptual_hash = await loop.run_in_executor(DECODE_POOL, _perceptual_hash, image_bytes)
+                if perceptual_hash:
+                    perceptual_hash = cache_manager.hashed_key(perceptual_hash, precision)
+                    detection_result = cache_manager.get_similar_detection(perceptual_hash, confidence)
+                    if detection_result is None:
+                        detection_result = await cache_manager.get_shared_detection(perceptual_hash, confidence)
+            
+            if detection_result is None:
+                # Exact, near-duplicate and shared tiers all missed
+                cache_manager.record_miss(image_hash, confidence)
+                image = await loop.run_in_executor(DECODE_POOL, _decode_image, image_bytes)
+                
+                # Run military-grade detection
+                detection_result = await model_wrapper.detect_humans(
+                    image, confidence, cache_key=image_hash, perceptual_key=perceptual_hash, precision=precision
+                )
+                logger.debug("✅ Detection complete: %s", detection_result)
         
         # Classify threat level
-        threat_level = "CRITICAL" if detection_result["count"] > 3 else \
-                     "HIGH" if detection_result["count"] > 1 else \
-                     "MEDIUM" if detection_result["count"] > 0 else "LOW"
+        threat_level = THREAT_LEVELS[min(detection_result["count"], 4)]
         
-        # FIXED: Return both old and new format for compatibility
         response = {
             # New military format
             "classification": "RESTRICTED",
-            "operation_id": f"GUARD-X-{datetime.now().strftime('%Y%m%d-%H%M%S')}",
+            "operation_id": f"GUARD-X-{time.time_ns():x}",
             "operator": current_user["username"],
             "unit": current_user["unit"],
             "clearance": current_user["clearance_level"],
@@ -146,32 +327,38 @@ async def military_threat_detection(
                 "bounding_boxes": detection_result["boxes"],
                 "threat_assessment": threat_level,
                 "model_used": detection_result["model_type"],
+                "precision": precision,
                 "processing_time": detection_result["processing_time"],
                 "confidence_threshold": detection_result["confidence_threshold"]
             },
             "image_metadata": {
                 "filename": file.filename,
-                "dimensions": f"{image.width}x{image.height}",
-                "format": image.mode
+                "dimensions": f"{width}x{height}",
+                "format": "RGB"
             },
-            "timestamp": datetime.now().isoformat(),
-            "status": "MISSION_COMPLETE" if detection_result["count"] == 0 else "THREATS_DETECTED",
-            
-            # OLD FORMAT FOR COMPATIBILITY (Frontend expects this)
-            "success": True,
-            "boxes": detection_result["boxes"],
-            "count": detection_result["count"],
-            "confidence_scores": detection_result["confidences"],
-            "model_used": detection_result["model_type"],
-            "processing_time": detection_result["processing_time"],
-            "image_size": {
-                "width": image.width,
-                "height": image.height
-            }
+            "timestamp": _NOW_ISO,
+            "status": "MISSION_COMPLETE" if detection_result["count"] == 0 else "THREATS_DETECTED"
         }
         
-        return JSONResponse(content=response)
+        if compat:
+            # OLD FORMAT for clients that have not moved to the nested "detection" block
+            response.update({
+                "success": True,
+                "boxes": detection_result["boxes"],
+                "count": detection_result["count"],
+                "confidence_scores": detection_result["confidences"],
+                "model_used": detection_result["model_type"],
+                "processing_time": detection_result["processing_time"],
+                "image_size": {
+                    "width": width,
+                    "height": height
+                }
+            })
+        
+        return ORJSONResponse(response)
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ MILITARY DETECTION ERROR: {e}")
         raise HTTPException(status_code=500, detail=f"SYSTEM FAILURE: {str(e)}")
@@ -188,12 +375,12 @@ async def admin_system_status(current_user = Depends(require_admin_access)):
         "version": "2.0.0-MILITARY",
         "status": "OPERATIONAL" if health_status.get("models_loaded") else "DEGRADED",
         "admin": current_user["username"],
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": _NOW_ISO,
         "capabilities": {
             "image_threat_detection": True,
             "realtime_surveillance": True,
             "military_authentication": True,
-            "custom_ai_model": "best.pt" in str(Path("models/best.pt")) and Path("models/best.pt").exists(),
+            "custom_ai_model": _HAS_CUSTOM_MODEL,
             "clearance_levels": ["SECRET", "TOP_SECRET"],
             "active_units": ["CYBER_WARFARE_DIVISION", "SURVEILLANCE_OPERATIONS"]
         },
@@ -219,9 +406,17 @@ async def test_camera():
 @app.get("/api/health")
 async def health_check():
     """System health check"""
+    error = _init_error()
+    ready = _init_task is not None and _init_task.done() and error is None
+    if error is not None:
+        status = "degraded"
+    else:
+        status = "operational" if ready else "initializing"
     return {
-        "status": "operational",
-        "timestamp": datetime.now().isoformat(),
+        "status": status,
+        "ready": ready,
+        "init_error": repr(error) if error is not None else None,
+        "timestamp": _NOW_ISO,
         "models_loaded": len(model_wrapper.models) > 0,
         "active_model": model_wrapper.active_model_name
     }
@@ -235,14 +430,14 @@ async def get_cache_stats(current_user = Depends(get_current_user)):
         return {
             "cache_performance": stats,
             "status": "operational",
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _NOW_ISO
         }
     except Exception as e:
         print(f"❌ Cache stats error: {e}")
         return {
             "cache_performance": {"error": str(e)},
             "status": "error",
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _NOW_ISO
         }
 
 @app.post("/api/cache/clear")
@@ -253,7 +448,7 @@ async def clear_cache(current_user = Depends(require_admin_access)):
         return {
             "message": "Cache cleared successfully",
             "status": "success",
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _NOW_ISO
         }
     except Exception as e:
         print(f"❌ Cache clear error: {e}")
@@ -263,12 +458,14 @@ async def clear_cache(current_user = Depends(require_admin_access)):
 @app.post("/api/security/start-monitoring")
 async def start_anti_jamming(current_user = Depends(require_admin_access)):
     """Start anti-jamming monitoring"""
+    if not _OWNS_MONITORS:
+        raise HTTPException(status_code=409, detail="MONITORING RUNS IN ANOTHER WORKER")
     try:
         asyncio.create_task(anti_jamming_system.start_monitoring())
         return {
             "message": "Anti-jamming system activated",
             "status": "success",
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _NOW_ISO
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to start monitoring: {str(e)}")
@@ -280,7 +477,7 @@ async def get_jamming_status(current_user = Depends(get_current_user)):
         status = anti_jamming_system.get_system_status()
         return {
             "anti_jamming_status": status,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _NOW_ISO
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Status check failed: {str(e)}")
@@ -292,7 +489,7 @@ async def test_jamming_detection(current_user = Depends(require_admin_access)):
         # Simulate jamming event for testing
         test_event = {
             'type': 'test',
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': _NOW_ISO,
             'details': {'test_mode': True},
             'severity': 'MEDIUM'
         }
@@ -307,13 +504,38 @@ async def test_jamming_detection(current_user = Depends(require_admin_access)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Test failed: {str(e)}")
 
+# Alert side effects run on a consumer task so the monitoring loops never wait on I/O
+ALERT_QUEUE = asyncio.Queue(maxsize=1024)
+ALERT_LABELS = {"jamming": "🚨 JAMMING ALERT", "drone": "🚁 DRONE ALERT"}
+
+def _enqueue_alert(kind, event):
+    """Queue an alert, dropping the oldest one if the consumer has fallen behind"""
+    if ALERT_QUEUE.full():
+        ALERT_QUEUE.get_nowait()
+    ALERT_QUEUE.put_nowait((kind, event))
+
+async def _console_alert_sink(kind, event):
+    """Echo alerts to the operator console"""
+    print(f"{ALERT_LABELS[kind]}: {event}")
+
+# Every sink sees every alert, concurrently; WebSocket broadcast and security DB logging plug in here
+ALERT_SINKS = [_console_alert_sink]
+
+async def _alert_consumer():
+    """Drain ALERT_QUEUE, fanning each alert out to all sinks"""
+    while True:
+        kind, event = await ALERT_QUEUE.get()
+        results = await asyncio.gather(
+            *(sink(kind, event) for sink in ALERT_SINKS), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"❌ Alert sink error: {result}")
+
 # Register jamming alert callback
 async def jamming_alert_handler(jamming_event):
     """Handle jamming alerts"""
-    print(f"🚨 JAMMING ALERT: {jamming_event}")
-    # Send to all connected WebSocket clients
-    # Trigger emergency protocols
-    # Log to security database
+    _enqueue_alert("jamming", jamming_event)
 
 anti_jamming_system.register_alert_callback(jamming_alert_handler)
 
@@ -341,40 +563,24 @@ async def emergency_rth_all(current_user = Depends(require_admin_access)):
 @app.get("/api/detections/swarm")
 async def get_swarm_detections():
     """Get drone swarm detection data"""
-    fleet_status = drone_fleet.get_fleet_status()
-    
-    return {
-        "timestamp": datetime.now().isoformat(),
-        "total_drones": fleet_status['total_drones'],
-        "active_drones": fleet_status['active_drones'],
-        "detections": [
-            {
-                "drone_id": drone_id,
-                "lat": drone['lat'],
-                "lon": drone['lon'],
-                "alt": drone['alt'],
-                "battery": drone['battery'],
-                "status": drone['status'],
-                "detection": drone.get('detection', 'Clear'),
-                "confidence": drone.get('confidence', 0.0),
-                "returning_home": drone.get('returning_home', False),
-                "rth_reason": drone.get('rth_reason', None)
-            }
-            for drone_id, drone in fleet_status['drones'].items()
-        ]
-    }
+    # Built from the fleet's field arrays rather than materializing every drone dict
+    return {"timestamp": _NOW_ISO, **drone_fleet.get_swarm_status()}
 
 # Register drone alert handler
 async def drone_alert_handler(alert_data):
     """Handle drone alerts"""
-    print(f"🚁 DRONE ALERT: {alert_data}")
-    # Send to WebSocket clients, log to database, etc.
+    _enqueue_alert("drone", alert_data)
 
 drone_fleet.register_alert_callback(drone_alert_handler)
 
 if __name__ == "__main__":
     print("🎖️  STARTING GUARD-X MILITARY SERVER v2.0...")
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
+    if os.getenv("GUARDX_ENV", "development") == "production":
+        # uvloop + httptools; extra workers only when WEB_CONCURRENCY asks for them
+        uvicorn.run("app:app", host="0.0.0.0", port=8000, loop="uvloop", http="httptools",
+                    workers=int(os.getenv("WEB_CONCURRENCY", 1)))
+    else:
+        uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
 
 
 
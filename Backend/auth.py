@@ -4,6 +4,7 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 import os
+from functools import lru_cache
 from pydantic import BaseModel
 from typing import Optional
 
@@ -126,21 +127,23 @@ def require_admin_access(current_user = Depends(get_current_user)):
         )
     return current_user
 
+# Clearance levels, lowest to highest
+CLEARANCE_RANKS = {level: rank for rank, level in enumerate(["PUBLIC", "CONFIDENTIAL", "SECRET", "TOP_SECRET"])}
+
+@lru_cache(maxsize=8)
 def require_clearance_level(required_level: str):
-    """Require specific clearance level"""
+    """Require specific clearance level (one shared dependency per level)"""
+    required_index = CLEARANCE_RANKS.get(required_level)
+    
     def check_clearance(current_user = Depends(get_current_user)):
-        user_clearance = current_user.get("clearance_level", "")
-        clearance_hierarchy = ["PUBLIC", "CONFIDENTIAL", "SECRET", "TOP_SECRET"]
+        user_index = CLEARANCE_RANKS.get(current_user.get("clearance_level", ""))
         
-        if required_level not in clearance_hierarchy or user_clearance not in clearance_hierarchy:
+        if required_index is None or user_index is None:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="INVALID CLEARANCE LEVEL"
             )
         
-        required_index = clearance_hierarchy.index(required_level)
-        user_index = clearance_hierarchy.index(user_clearance)
-        
         if user_index < required_index:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -1,34 +1,101 @@
+import os
 import time
-import hashlib
-import json
+import orjson
+import xxhash
+import asyncio
+from collections import OrderedDict
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 import threading
+import logging
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+logger = logging.getLogger("guardx")
+
+CACHE_SHARDS = 16  # power of two so the shard index is a mask
+# Optional shared detection cache behind the in-process one, so uvicorn workers reuse each other's results
+REDIS_URL = os.getenv("REDIS_URL")
 
 class CacheManager:
     def __init__(self):
-        self.detection_cache = {}
+        # Each shard is ordered oldest-used first, so eviction is popitem(last=False)
+        self.detection_shards = [OrderedDict() for _ in range(CACHE_SHARDS)]
+        self.frame_shards = [OrderedDict() for _ in range(CACHE_SHARDS)]
         self.model_cache = {}
-        self.frame_cache = {}
-        self.cache_stats = {
-            "hits": 0,
-            "misses": 0,
-            "total_requests": 0
-        }
-        self.lock = threading.Lock()
+        # Counters live with their shard and are summed in get_stats
+        self.shard_stats = [
+            {"hits": 0, "near_hits": 0, "shared_hits": 0, "misses": 0, "total_requests": 0}
+            for _ in range(CACHE_SHARDS)
+        ]
+        self.locks = [threading.Lock() for _ in range(CACHE_SHARDS)]
+        # Connects lazily on first command
+        self.redis = aioredis.from_url(REDIS_URL) if REDIS_URL and aioredis is not None else None
         
         # Cache settings
         self.detection_ttl = 300  # 5 minutes
-        self.frame_ttl = 60       # 1 minute
+        self.frame_ttl = 2        # frame keys are perceptual, so only reuse within a couple of seconds
         self.max_cache_size = 1000
+        self.sweep_interval = 30  # seconds between TTL sweeps
         
     def _generate_key(self, data: Any) -> str:
-        """Generate cache key from data"""
+        """Generate cache key from data (non-cryptographic xxh3, raw buffers hashed in place)"""
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return xxhash.xxh3_64(data).hexdigest()
         if isinstance(data, dict):
-            data_str = json.dumps(data, sort_keys=True)
+            # Keys are unique, so sorting never compares values; nested values are repr()d as-is
+            data_str = repr(tuple(sorted(data.items())))
         else:
             data_str = str(data)
-        return hashlib.md5(data_str.encode()).hexdigest()
+        return xxhash.xxh3_64(data_str.encode()).hexdigest()
+    
+    def content_key(self, data: Any, precision: str) -> str:
+        """Cache key for a detection on data (upload bytes or a pixel buffer) at a model precision"""
+        return self.hashed_key(self._generate_key(data), precision)
+    
+    def hashed_key(self, digest: str, precision: str) -> str:
+        """Cache key for an already computed digest (e.g. a perceptual hash); precision changes the boxes"""
+        return f"{digest}-{precision}"
+    
+    def _entry_key(self, image_hash: str, confidence: float) -> str:
+        """Key a result is stored under locally and in Redis"""
+        return f"{image_hash}_{confidence}"
+    
+    def _shard(self, cache_key: str) -> int:
+        """Pick the shard (and lock) that owns a key"""
+        return hash(cache_key) & (CACHE_SHARDS - 1)
+    
+    def _insert(self, shards: list, cache_key: str, result: Dict):
+        """Insert into the owning shard, holding all of shards to max_cache_size entries in total.
+        The limit is global so a hot shard can use room the others leave empty; eviction is LRU
+        within the inserting shard and only falls back to the fullest other shard when it runs dry."""
+        shard = self._shard(cache_key)
+        
+        with self.locks[shard]:
+            cache = shards[shard]
+            cache.pop(cache_key, None)  # re-inserting a key doesn't grow the cache
+            # Other shards' sizes are read without their locks; concurrent inserts may overshoot briefly
+            excess = sum(len(other) for other in shards) + 1 - self.max_cache_size
+            # Evict least recently used entries; expired ones are left to the sweeper
+            while excess > 0 and cache:
+                cache.popitem(last=False)
+                excess -= 1
+            cache[cache_key] = {
+                "data": result,
+                "timestamp": time.time()
+            }
+        
+        # Taken one at a time after releasing our own lock, so two inserters can't deadlock
+        while excess > 0:
+            victim = max(range(CACHE_SHARDS), key=lambda i: len(shards[i]))
+            with self.locks[victim]:
+                if not shards[victim]:
+                    break
+                shards[victim].popitem(last=False)
+            excess -= 1
     
     def _is_expired(self, timestamp: float, ttl: int) -> bool:
         """Check if cache entry is expired"""
@@ -44,82 +111,165 @@ class CacheManager:
         for key in expired_keys:
             del cache_dict[key]
     
-    def get_detection(self, image_hash: str, confidence: float) -> Optional[Dict]:
-        """Get cached detection result"""
-        with self.lock:
-            self.cache_stats["total_requests"] += 1
-            
-            cache_key = f"{image_hash}_{confidence}"
-            
-            if cache_key in self.detection_cache:
-                entry = self.detection_cache[cache_key]
-                if not self._is_expired(entry["timestamp"], self.detection_ttl):
-                    self.cache_stats["hits"] += 1
-                    print(f"🎯 Cache HIT for detection: {cache_key[:8]}...")
-                    return entry["data"]
-                else:
-                    del self.detection_cache[cache_key]
-            
-            self.cache_stats["misses"] += 1
-            print(f"❌ Cache MISS for detection: {cache_key[:8]}...")
+    def _probe_detection(self, cache_key: str) -> Optional[Dict]:
+        """Look up one detection key, dropping it if expired"""
+        shard = self._shard(cache_key)
+        
+        with self.locks[shard]:
+            cache = self.detection_shards[shard]
+            entry = cache.get(cache_key)
+            if entry is None:
+                return None
+            if self._is_expired(entry["timestamp"], self.detection_ttl):
+                del cache[cache_key]
+                return None
+            cache.move_to_end(cache_key)
+            return entry["data"]
+    
+    def _count(self, cache_key: str, outcome: Optional[str], new_request: bool = True):
+        """Bump the stats of the shard that owns cache_key (outcome None counts only the request)"""
+        shard = self._shard(cache_key)
+        with self.locks[shard]:
+            stats = self.shard_stats[shard]
+            if new_request:
+                stats["total_requests"] += 1
+            if outcome:
+                stats[outcome] += 1
+    
+    def get_detection(self, image_hash: str, confidence: float, count_miss: bool = True) -> Optional[Dict]:
+        """Get cached detection result. Callers that go on to probe other tiers pass count_miss=False
+        and call record_miss once all of them missed."""
+        cache_key = self._entry_key(image_hash, confidence)
+        result = self._probe_detection(cache_key)
+        
+        if result is not None:
+            self._count(cache_key, "hits")
+            logger.debug("🎯 Cache HIT for detection: %.8s...", cache_key)
+        else:
+            self._count(cache_key, "misses" if count_miss else None)
+            logger.debug("❌ Cache MISS for detection: %.8s...", cache_key)
+        return result
+    
+    def record_miss(self, image_hash: str, confidence: float):
+        """Count a miss for a request already counted by get_detection(count_miss=False)"""
+        self._count(self._entry_key(image_hash, confidence), "misses", new_request=False)
+    
+    def get_similar_detection(self, perceptual_hash: str, confidence: float) -> Optional[Dict]:
+        """Get a result cached for a near-duplicate image, after get_detection missed"""
+        cache_key = self._entry_key(perceptual_hash, confidence)
+        result = self._probe_detection(cache_key)
+        
+        if result is not None:
+            self._count(cache_key, "near_hits", new_request=False)
+            logger.debug("🎯 Cache NEAR HIT for detection: %.8s...", cache_key)
+        return result
+    
+    def _store_detection(self, cache_key: str, result: Dict):
+        """Insert one detection entry, evicting least recently used ones"""
+        self._insert(self.detection_shards, cache_key, result)
+    
+    def set_detection(self, image_hash: str, confidence: float, result: Dict,
+                      perceptual_hash: Optional[str] = None):
+        """Cache detection result under its exact key and, if given, its perceptual key"""
+        keys = [image_hash] if not perceptual_hash else [image_hash, perceptual_hash]
+        for key in keys:
+            self._store_detection(self._entry_key(key, confidence), result)
+        logger.debug("💾 Cached detection result: %.8s...", image_hash)
+    
+    async def get_shared_detection(self, image_hash: str, confidence: float) -> Optional[Dict]:
+        """Look a key up in Redis after the in-process cache missed, keeping a local copy on a hit"""
+        if self.redis is None:
             return None
+        
+        cache_key = self._entry_key(image_hash, confidence)
+        try:
+            payload = await self.redis.get(f"det:{cache_key}")
+        except Exception as e:
+            logger.warning("⚠️ Redis GET failed: %s", e)
+            return None
+        if payload is None:
+            return None
+        
+        result = orjson.loads(payload)
+        self._store_detection(cache_key, result)
+        self._count(cache_key, "shared_hits", new_request=False)
+        logger.debug("🎯 Shared cache HIT for detection: %.8s...", cache_key)
+        return result
     
-    def set_detection(self, image_hash: str, confidence: float, result: Dict):
-        """Cache detection result"""
-        with self.lock:
-            cache_key = f"{image_hash}_{confidence}"
-            
-            # Cleanup if cache is too large
-            if len(self.detection_cache) >= self.max_cache_size:
-                self._cleanup_cache(self.detection_cache, self.detection_ttl)
-            
-            self.detection_cache[cache_key] = {
-                "data": result,
-                "timestamp": time.time()
-            }
-            print(f"💾 Cached detection result: {cache_key[:8]}...")
+    async def share_detection(self, image_hash: str, confidence: float, result: Dict,
+                              perceptual_hash: Optional[str] = None):
+        """Publish a result to Redis under the same keys set_detection used"""
+        if self.redis is None:
+            return
+        
+        payload = orjson.dumps(result)
+        keys = [image_hash] if not perceptual_hash else [image_hash, perceptual_hash]
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.setex(f"det:{self._entry_key(key, confidence)}", self.detection_ttl, payload)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning("⚠️ Redis SETEX failed: %s", e)
     
     def get_frame_detection(self, frame_hash: str) -> Optional[Dict]:
         """Get cached frame detection"""
-        with self.lock:
-            if frame_hash in self.frame_cache:
-                entry = self.frame_cache[frame_hash]
+        shard = self._shard(frame_hash)
+        
+        with self.locks[shard]:
+            cache = self.frame_shards[shard]
+            if frame_hash in cache:
+                entry = cache[frame_hash]
                 if not self._is_expired(entry["timestamp"], self.frame_ttl):
+                    cache.move_to_end(frame_hash)
                     return entry["data"]
                 else:
-                    del self.frame_cache[frame_hash]
+                    del cache[frame_hash]
             return None
     
     def set_frame_detection(self, frame_hash: str, result: Dict):
         """Cache frame detection result"""
-        with self.lock:
-            if len(self.frame_cache) >= self.max_cache_size:
-                self._cleanup_cache(self.frame_cache, self.frame_ttl)
-            
-            self.frame_cache[frame_hash] = {
-                "data": result,
-                "timestamp": time.time()
-            }
+        self._insert(self.frame_shards, frame_hash, result)
+    
+    async def run_ttl_sweeper(self):
+        """Periodically drop expired entries off the request path"""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            for shard in range(CACHE_SHARDS):
+                with self.locks[shard]:
+                    self._cleanup_cache(self.detection_shards[shard], self.detection_ttl)
+                    self._cleanup_cache(self.frame_shards[shard], self.frame_ttl)
     
     def get_stats(self) -> Dict:
         """Get cache statistics"""
-        with self.lock:
-            hit_rate = (self.cache_stats["hits"] / max(self.cache_stats["total_requests"], 1)) * 100
-            return {
-                **self.cache_stats,
-                "hit_rate": round(hit_rate, 2),
-                "cache_sizes": {
-                    "detections": len(self.detection_cache),
-                    "frames": len(self.frame_cache)
-                }
+        totals = {"hits": 0, "near_hits": 0, "shared_hits": 0, "misses": 0, "total_requests": 0}
+        detections = frames = 0
+        for shard in range(CACHE_SHARDS):
+            with self.locks[shard]:
+                for name, value in self.shard_stats[shard].items():
+                    totals[name] += value
+                detections += len(self.detection_shards[shard])
+                frames += len(self.frame_shards[shard])
+        
+        hit_rate = ((totals["hits"] + totals["near_hits"] + totals["shared_hits"])
+                    / max(totals["total_requests"], 1)) * 100
+        return {
+            **totals,
+            "hit_rate": round(hit_rate, 2),
+            "shared_cache": self.redis is not None,
+            "cache_sizes": {
+                "detections": detections,
+                "frames": frames
             }
+        }
     
     def clear_cache(self):
         """Clear all caches"""
-        with self.lock:
-            self.detection_cache.clear()
-            self.frame_cache.clear()
-            print("🧹 Cache cleared")
+        for shard in range(CACHE_SHARDS):
+            with self.locks[shard]:
+                self.detection_shards[shard].clear()
+                self.frame_shards[shard].clear()
+        print("🧹 Cache cleared")
 
 # Global cache instance
 cache_manager = CacheManager()
\ No newline at end of file
@@ -73,7 +73,7 @@ class CameraManager:
                 
                 # Run detection every 3rd frame for performance
                 if frame_count % 3 == 0:
-                    detection_result = await self.model_wrapper.detect_realtime_frame(frame)
+                    detection_result = await self.model_wrapper.detect_realtime_frame(frame, stream_id="camera")
                 else:
                     detection_result = {"boxes": [], "count": 0, "confidences": []}
                 
@@ -1,19 +1,201 @@
 import asyncio
+import heapq
+import itertools
+import math
 import time
 import os
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Set
 import json
+import numpy as np
+
+# Hot per-drone fields are stored as parallel arrays (one slot per drone); everything else stays in a dict
+HOT_FIELDS = ('lat', 'lon', 'alt', 'battery', 'status', 'returning_home')
+FLOAT_FIELDS = ('lat', 'lon', 'alt', 'battery')
+STATUS_ACTIVE, STATUS_RETURNING, STATUS_LANDED = 0, 1, 2
+INITIAL_CAPACITY = 64
+# Battery is modelled lazily: level at battery_ts plus a status-dependent rate
+BATTERY_DRAIN_PER_SEC = 0.05   # in flight (0.5% per 10 s)
+BATTERY_CHARGE_PER_SEC = 0.2   # landed (2% per 10 s)
+BATTERY_KEYS = frozenset(('battery', 'status', 'returning_home'))
+BATTERY_DECIMALS = 2  # precision of battery levels handed out in API dicts and alerts
+# Everything stored per slot; removal moves all of these together
+SLOT_ARRAYS = HOT_FIELDS + ('battery_ts', '_generation')
+# Home base; its trig terms are fixed, so they are computed once
+HOME_LAT, HOME_LON = 28.7041, 77.1025
+HOME_LAT_RAD = float(np.radians(HOME_LAT))
+HOME_COS_LAT = float(np.cos(HOME_LAT_RAD))
+# Fraction of the way home at each step of a simulated return
+RETURN_STEPS = 10
+RETURN_PROGRESS = np.linspace(0.0, 1.0, RETURN_STEPS + 1)
+# Seconds cancelled monitor/return tasks get to finish unwinding
+SHUTDOWN_DEADLINE = 5.0
+# Emergency events are appended here as JSON lines by a single writer task
+EMERGENCY_LOG = os.path.join("logs", "emergency_events.jsonl")
 
 class DroneFleetManager:
     def __init__(self):
+        # drone_id -> cold fields (detection, confidence, rth_reason, timestamps, ...)
         self.drones = {}
+        self._index: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._count = 0
+        # Status code -> name; unknown statuses get a code on first sight
+        self._status_names = ['active', 'returning', 'landed']
+        # Missing float fields are NaN, which never satisfies a threshold comparison
+        self.lat = np.full(INITIAL_CAPACITY, np.nan)
+        self.lon = np.full(INITIAL_CAPACITY, np.nan)
+        self.alt = np.full(INITIAL_CAPACITY, np.nan)
+        self.battery = np.full(INITIAL_CAPACITY, np.nan)
+        self.status = np.zeros(INITIAL_CAPACITY, dtype=np.int16)
+        self.returning_home = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self.battery_ts = np.zeros(INITIAL_CAPACITY)
+        # Set from a fleet-wide counter on every battery/status change; heap entries with another value are stale
+        self._generation = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._generations = itertools.count(1)
+        # (monotonic time of next threshold crossing, drone_id, generation)
+        self._battery_heap = []
+        self._battery_wakeup = asyncio.Event()
         self.rth_threshold = 20  # Battery percentage for auto RTH
         self.emergency_rth_threshold = 10  # Critical battery level
         self.monitoring = False
         self.alert_callbacks = []
         # Keep references to running tasks (optional, useful for graceful shutdown)
         self._tasks: List[asyncio.Task] = []
+        # Running return journeys; the loop only holds weak references to tasks, so we keep strong ones
+        self._return_tasks: Set[asyncio.Task] = set()
+        # Emergency log records waiting for the writer task
+        self._log_queue = asyncio.Queue(maxsize=1024)
+        self._log_task = None
+        try:
+            os.makedirs(os.path.dirname(EMERGENCY_LOG), exist_ok=True)
+        except Exception as e:
+            print(f"❌ Could not create logs directory: {e}")
+
+    def _status_code(self, name) -> int:
+        """Map a status name to its array code"""
+        try:
+            return self._status_names.index(name)
+        except ValueError:
+            self._status_names.append(name)
+            return len(self._status_names) - 1
+
+    def _reserve(self, size: int):
+        """Grow the field arrays (doubling) so at least `size` drones fit"""
+        capacity = len(self.battery)
+        if size <= capacity:
+            return
+        new_capacity = max(size, capacity * 2)
+        for name in SLOT_ARRAYS:
+            old = getattr(self, name)
+            grown = np.full(new_capacity, np.nan) if name in FLOAT_FIELDS else np.zeros(new_capacity, dtype=old.dtype)
+            grown[:capacity] = old
+            setattr(self, name, grown)
+
+    def _battery_rate(self, i: int) -> float:
+        """Battery change per second for the drone in slot i"""
+        status = self.status[i]
+        if status == STATUS_ACTIVE and not self.returning_home[i]:
+            return -BATTERY_DRAIN_PER_SEC
+        if status == STATUS_LANDED:
+            return BATTERY_CHARGE_PER_SEC
+        return 0.0
+
+    def _settle(self, i: int) -> float:
+        """Bring slot i's battery up to now under its current rate and return it"""
+        if not self.monitoring:
+            return float(self.battery[i])  # frozen while nothing is flying the fleet
+        now = time.monotonic()
+        rate = self._battery_rate(i)
+        if rate:
+            self.battery[i] = np.clip(self.battery[i] + rate * (now - self.battery_ts[i]), 0.0, 100.0)
+        self.battery_ts[i] = now
+        return float(self.battery[i])
+
+    def _settle_all(self):
+        """Vectorized _settle over the whole fleet"""
+        if not self.monitoring:
+            return
+        n = self._count
+        now = time.monotonic()
+        status = self.status[:n]
+        rate = np.where((status == STATUS_ACTIVE) & ~self.returning_home[:n], -BATTERY_DRAIN_PER_SEC,
+                        np.where(status == STATUS_LANDED, BATTERY_CHARGE_PER_SEC, 0.0))
+        battery = self.battery[:n]
+        battery += rate * (now - self.battery_ts[:n])
+        np.clip(battery, 0.0, 100.0, out=battery)
+        self.battery_ts[:n] = now
+
+    def _schedule_battery_event(self, i: int):
+        """Queue slot i's next RTH threshold crossing, invalidating any earlier entry"""
+        self._generation[i] = next(self._generations)
+        battery = self.battery[i]
+        if np.isnan(battery) or self.status[i] != STATUS_ACTIVE:
+            return
+        if self.returning_home[i]:
+            if battery > self.emergency_rth_threshold:
+                return  # not draining, so it never gets there
+            delay = 0.0
+        elif battery > self.rth_threshold:
+            delay = (battery - self.rth_threshold) / BATTERY_DRAIN_PER_SEC
+        else:
+            delay = 0.0
+
+        # Drop stale entries once they outnumber live drones
+        if len(self._battery_heap) > 4 * self._count + 64:
+            self._battery_heap = [
+                entry for entry in self._battery_heap
+                if entry[1] in self._index and self._generation[self._index[entry[1]]] == entry[2]
+            ]
+            heapq.heapify(self._battery_heap)
+
+        heapq.heappush(self._battery_heap, (self.battery_ts[i] + delay, self._ids[i], int(self._generation[i])))
+        self._battery_wakeup.set()
+
+    def update_drone(self, drone_id: str, fields: dict):
+        """Write fields for a drone, routing hot ones to the arrays"""
+        i = self._index[drone_id]
+        cold = self.drones[drone_id]
+        battery_affected = not BATTERY_KEYS.isdisjoint(fields)
+        if battery_affected:
+            # Account for drain/charge under the old status before it changes
+            self._settle(i)
+        for key, value in fields.items():
+            if key in FLOAT_FIELDS:
+                getattr(self, key)[i] = np.nan if value is None else float(value)
+            elif key == 'status':
+                self.status[i] = self._status_code(value)
+            elif key == 'returning_home':
+                self.returning_home[i] = bool(value)
+            else:
+                cold[key] = value
+        if battery_affected:
+            self._schedule_battery_event(i)
+
+    def get_drone(self, drone_id: str) -> dict:
+        """Materialize one drone as a plain dict"""
+        i = self._index[drone_id]
+        self._settle(i)
+        drone = dict(self.drones[drone_id])
+        for key in FLOAT_FIELDS:
+            value = getattr(self, key)[i]
+            if not np.isnan(value):
+                drone[key] = round(float(value), BATTERY_DECIMALS) if key == 'battery' else float(value)
+        status = self._status_names[self.status[i]]
+        if status is not None:
+            drone['status'] = status
+        drone['returning_home'] = bool(self.returning_home[i])
+        return drone
+
+    def _battery_of(self, drone_id: str) -> float:
+        """Battery level for alerts (0 when unknown)"""
+        battery = self._settle(self._index[drone_id])
+        return 0.0 if np.isnan(battery) else round(battery, BATTERY_DECIMALS)
+
+    def _snapshot(self):
+        """Copy of (ids, status) that stays in step across awaits, even if drones are added or removed"""
+        n = self._count
+        return list(self._ids), self.status[:n].copy()
 
     async def start_monitoring(self):
         """Start continuous drone monitoring"""
@@ -22,61 +204,75 @@ class DroneFleetManager:
             return
 
         self.monitoring = True
+        # Batteries were frozen while stopped, so drain/charge (and every threshold ETA) starts from now
+        self.battery_ts[:self._count] = time.monotonic()
+        self._battery_heap = []
+        for i in range(self._count):
+            self._schedule_battery_event(i)
         print("🚁 Drone fleet monitoring started")
 
         # Create background tasks and keep references so we can cancel on shutdown
+        children = []
         try:
             battery_task = asyncio.create_task(self.monitor_battery_levels(), name="battery-monitor")
             health_task = asyncio.create_task(self.monitor_drone_health(), name="health-monitor")
             pos_task = asyncio.create_task(self.update_drone_positions(), name="position-updater")
 
             self._tasks = [battery_task, health_task, pos_task]
+            children = list(self._tasks)
 
-            # Wait until tasks finish (they typically run forever until cancelled)
-            await asyncio.gather(*self._tasks)
+            # Run until one monitor fails (they otherwise run until cancelled); its siblings are cancelled below
+            done, _ = await asyncio.wait(self._tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for t in done:
+                if not t.cancelled() and t.exception() is not None:
+                    print(f"❌ {t.get_name()} crashed: {t.exception()}")
         except asyncio.CancelledError:
             print("start_monitoring cancelled; cancelling child tasks...")
-            for t in self._tasks:
-                t.cancel()
+            children += list(self._return_tasks)
             raise
-        except Exception as e:
-            print(f"❌ start_monitoring crashed: {e}")
         finally:
+            # Bank the drain up to now before the levels freeze
+            self._settle_all()
             self.monitoring = False
+            for t in children:
+                t.cancel()
+            # Bounded wait so a child stuck in cleanup can't hold up shutdown
+            if children:
+                await asyncio.wait(children, timeout=SHUTDOWN_DEADLINE)
             self._tasks = []
+            await self._stop_emergency_log_writer()
 
     async def monitor_battery_levels(self):
-        """Monitor all drone battery levels"""
+        """Dispatch RTH at the moment each drone's battery crosses a threshold"""
         while self.monitoring:
             try:
-                # Iterate over a snapshot of items to avoid RuntimeError if dict changes
-                for drone_id, drone in list(self.drones.items()):
+                self._battery_wakeup.clear()
+                if not self._battery_heap:
+                    await self._battery_wakeup.wait()
+                    continue
+
+                event_time, drone_id, generation = self._battery_heap[0]
+                delay = event_time - time.monotonic()
+                if delay > 0:
+                    # Sleep until the next crossing, or until a reschedule wakes us early
                     try:
-                        status = drone.get('status')
-                        battery = drone.get('battery')
-                        if status == 'active' and isinstance(battery, (int, float)):
-                            # Emergency RTH - Critical battery
-                            if battery <= self.emergency_rth_threshold:
-                                # ensure we await to sequence emergency flow
-                                await self.emergency_rth(drone_id, battery)
-
-                            # Auto RTH - Low battery
-                            elif battery <= self.rth_threshold and not drone.get('returning_home', False):
-                                await self.auto_rth(drone_id, battery)
-
-                            # Simulate battery drain during flight (if active and not returning)
-                            if status == 'active' and not drone.get('returning_home', False):
-                                # update by small float
-                                self.drones[drone_id]['battery'] = max(0.0, float(battery) - 0.5)
-
-                        # Simulate battery charging when landed
-                        elif status == 'landed':
-                            if isinstance(battery, (int, float)) and battery < 100:
-                                self.drones[drone_id]['battery'] = min(100.0, float(battery) + 2.0)
-                    except Exception as sub_e:
-                        print(f"❌ Error handling drone {drone_id} in battery monitor: {sub_e}")
-
-                await asyncio.sleep(10)  # Check every 10 seconds
+                        await asyncio.wait_for(self._battery_wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                heapq.heappop(self._battery_heap)
+                i = self._index.get(drone_id)
+                if i is None or self._generation[i] != generation:
+                    continue  # superseded by a later battery/status change
+
+                battery = round(self._settle(i), BATTERY_DECIMALS)
+                # Emergency RTH - Critical battery
+                if battery <= self.emergency_rth_threshold:
+                    await self.emergency_rth(drone_id, battery)
+                # Auto RTH - Low battery
+                else:
+                    await self.auto_rth(drone_id, battery)
 
             except Exception as e:
                 print(f"❌ Battery monitoring error: {e}")
@@ -87,11 +283,10 @@ class DroneFleetManager:
         while self.monitoring:
             try:
                 # example: check connectivity / heartbeat / sensor health
-                for drone_id, drone in list(self.drones.items()):
-                    # placeholder health check: ensure required keys exist
-                    if 'battery' not in drone:
-                        print(f"⚠️ Drone {drone_id} missing battery field")
-                    # add other health checks as needed...
+                # placeholder health check: ensure required fields exist
+                for i in np.flatnonzero(np.isnan(self.battery[:self._count])).tolist():
+                    print(f"⚠️ Drone {self._ids[i]} missing battery field")
+                # add other health checks as needed...
                 await asyncio.sleep(15)  # health-check interval
             except asyncio.CancelledError:
                 print("monitor_drone_health cancelled")
@@ -105,19 +300,12 @@ class DroneFleetManager:
         while self.monitoring:
             try:
                 # This is a light-weight simulation/update loop; in real world you'd read telemetry
-                # For now, optionally jitter positions slightly for demo purposes
-                for drone_id, drone in list(self.drones.items()):
-                    try:
-                        if drone.get('status') == 'active' and not drone.get('returning_home', False):
-                            # tiny random jitter so map shows movement (non-blocking)
-                            # keep deterministic minimal change to avoid too much drift
-                            lat = drone.get('lat', 0.0)
-                            lon = drone.get('lon', 0.0)
-                            # very small incremental move (no random import to keep deterministic)
-                            self.drones[drone_id]['lat'] = lat + 0.00001
-                            self.drones[drone_id]['lon'] = lon - 0.00001
-                    except Exception as sub_e:
-                        print(f"❌ Position update error for {drone_id}: {sub_e}")
+                # For now, nudge active drones slightly so the map shows movement
+                n = self._count
+                moving = (self.status[:n] == STATUS_ACTIVE) & ~self.returning_home[:n]
+                # very small incremental move (no random import to keep deterministic)
+                self.lat[:n][moving] += 0.00001
+                self.lon[:n][moving] -= 0.00001
                 await asyncio.sleep(5)  # position update interval
             except asyncio.CancelledError:
                 print("update_drone_positions cancelled")
@@ -137,7 +325,7 @@ class DroneFleetManager:
                 return
 
             # Update drone status
-            self.drones[drone_id].update({
+            self.update_drone(drone_id, {
                 'returning_home': True,
                 'rth_reason': 'low_battery',
                 'rth_initiated': datetime.now().isoformat(),
@@ -164,7 +352,7 @@ class DroneFleetManager:
         except Exception as e:
             print(f"❌ auto_rth error for {drone_id}: {e}")
 
-    async def emergency_rth(self, drone_id: str, battery_level: float):
+    async def emergency_rth(self, drone_id: str, battery_level: float, distance: Optional[float] = None):
         """Emergency return to home - critical battery"""
         try:
             print(f"🚨 EMERGENCY RTH: {drone_id} - CRITICAL BATTERY: {battery_level}%")
@@ -174,7 +362,7 @@ class DroneFleetManager:
                 return
 
             # Update drone status
-            self.drones[drone_id].update({
+            self.update_drone(drone_id, {
                 'returning_home': True,
                 'rth_reason': 'critical_battery',
                 'rth_initiated': datetime.now().isoformat(),
@@ -183,7 +371,7 @@ class DroneFleetManager:
             })
 
             # Calculate fastest return path
-            return_info = await self.calculate_emergency_return(drone_id)
+            return_info = await self.calculate_emergency_return(drone_id, distance)
 
             # Send emergency RTH command
             await self.send_emergency_rth_command(drone_id, return_info)
@@ -202,19 +390,19 @@ class DroneFleetManager:
         except Exception as e:
             print(f"❌ emergency_rth error for {drone_id}: {e}")
 
-    async def calculate_return_path(self, drone_id: str):
-        """Calculate optimal return path"""
-        drone = self.drones.get(drone_id)
-        if not drone:
+    async def calculate_return_path(self, drone_id: str, distance: Optional[float] = None):
+        """Calculate optimal return path (distance may be precomputed by a batch caller)"""
+        i = self._index.get(drone_id)
+        if i is None:
             return {'distance': 0, 'eta': 0, 'path': [], 'home_base': {'lat': 0, 'lon': 0}}
 
-        home_base = {'lat': 28.7041, 'lon': 77.1025}  # Base coordinates
+        home_base = {'lat': HOME_LAT, 'lon': HOME_LON}
+        lat = float(np.nan_to_num(self.lat[i]))
+        lon = float(np.nan_to_num(self.lon[i]))
 
         # Calculate distance to home (meters)
-        distance = self.calculate_distance(
-            float(drone.get('lat', 0.0)), float(drone.get('lon', 0.0)),
-            home_base['lat'], home_base['lon']
-        )
+        if distance is None:
+            distance = self.calculate_distance(lat, lon, home_base['lat'], home_base['lon'])
 
         # Estimate return time (assuming 15 m/s speed)
         # Ensure speed > 0
@@ -225,23 +413,27 @@ class DroneFleetManager:
             'distance': distance,
             'eta': eta_seconds,
             'path': [
-                {'lat': drone.get('lat'), 'lon': drone.get('lon')},
+                {'lat': lat, 'lon': lon},
                 {'lat': home_base['lat'], 'lon': home_base['lon']}
             ],
             'home_base': home_base
         }
 
-    async def calculate_emergency_return(self, drone_id: str):
+    async def calculate_emergency_return(self, drone_id: str, distance: Optional[float] = None):
         """Calculate fastest emergency return path"""
-        return_info = await self.calculate_return_path(drone_id)
+        return_info = await self.calculate_return_path(drone_id, distance)
         # Reduce ETA by 30% for emergency speed
-        try:
-            return_info['eta'] = float(return_info.get('eta', 0.0)) * 0.7
-            return_info['emergency_speed'] = True
-        except Exception:
-            pass
+        return_info['eta'] *= 0.7
+        return_info['emergency_speed'] = True
         return return_info
 
+    def _track_return(self, coro, name: str) -> asyncio.Task:
+        """Start a return journey task, holding it in _return_tasks until it finishes"""
+        task = asyncio.create_task(coro, name=name)
+        self._return_tasks.add(task)
+        task.add_done_callback(self._return_tasks.discard)
+        return task
+
     async def send_rth_command(self, drone_id: str, return_info: dict):
         """Send RTH command to drone"""
         print(f"📡 Sending RTH command to {drone_id}")
@@ -250,7 +442,7 @@ class DroneFleetManager:
         # For now, simulate the return journey as a background task
         # Use create_task so this function returns immediately
         try:
-            asyncio.create_task(self.simulate_return_journey(drone_id, return_info))
+            self._track_return(self.simulate_return_journey(drone_id, return_info), f"rth-{drone_id}")
         except Exception as e:
             print(f"❌ Failed to create simulate_return_journey task for {drone_id}: {e}")
 
@@ -259,44 +451,46 @@ class DroneFleetManager:
         print(f"🚨 Sending EMERGENCY RTH command to {drone_id}")
 
         try:
-            asyncio.create_task(self.simulate_emergency_return_journey(drone_id, return_info))
+            self._track_return(self.simulate_emergency_return_journey(drone_id, return_info), f"emergency-rth-{drone_id}")
         except Exception as e:
             print(f"❌ Failed to create simulate_emergency_return_journey task for {drone_id}: {e}")
 
     async def simulate_return_journey(self, drone_id: str, return_info: dict):
         """Simulate drone returning home"""
-        drone = self.drones.get(drone_id)
-        if not drone:
+        if drone_id not in self._index:
             print(f"❌ simulate_return_journey: unknown drone {drone_id}")
             return
 
-        home_base = return_info.get('home_base', {'lat': 28.7041, 'lon': 77.1025})
-        total_time = float(return_info.get('eta', 0.0))
+        home_base = return_info.get('home_base', {'lat': HOME_LAT, 'lon': HOME_LON})
+        total_time = return_info.get('eta', 0.0)
 
         print(f"🏠 {drone_id} returning home - ETA: {total_time:.1f}s")
 
         # Protect against zero ETA
-        steps = 10
-        sleep_per_step = (total_time / steps) if total_time > 0 else 0.5
-
-        for step in range(steps + 1):
-            progress = step / steps
-
-            # Interpolate position
-            current_lat = float(drone.get('lat', home_base['lat'])) + (home_base['lat'] - float(drone.get('lat', home_base['lat']))) * progress
-            current_lon = float(drone.get('lon', home_base['lon'])) + (home_base['lon'] - float(drone.get('lon', home_base['lon']))) * progress
-            current_alt = max(0, float(drone.get('alt', 50.0)) * (1 - progress))  # Descend gradually
-
-            # Update drone position
-            self.drones[drone_id].update({
-                'lat': current_lat,
-                'lon': current_lon,
-                'alt': current_alt
-            })
-
-            # reduce battery a bit while returning
-            if isinstance(self.drones[drone_id].get('battery'), (int, float)):
-                self.drones[drone_id]['battery'] = max(0.0, float(self.drones[drone_id]['battery']) - (0.5 * (1 + progress)))
+        sleep_per_step = (total_time / RETURN_STEPS) if total_time > 0 else 0.5
+
+        # Straight-line waypoints from where the drone is now (a missing coordinate starts at home)
+        i = self._index[drone_id]
+        start_lat = self.lat[i] if not np.isnan(self.lat[i]) else home_base['lat']
+        start_lon = self.lon[i] if not np.isnan(self.lon[i]) else home_base['lon']
+        start_alt = self.alt[i] if not np.isnan(self.alt[i]) else 50.0
+        lats = start_lat + (home_base['lat'] - start_lat) * RETURN_PROGRESS
+        lons = start_lon + (home_base['lon'] - start_lon) * RETURN_PROGRESS
+        alts = np.maximum(start_alt * (1 - RETURN_PROGRESS), 0.0)  # Descend gradually
+        # reduce battery a bit while returning (returning drones have no lazy drain)
+        drain = 0.5 * (1 + RETURN_PROGRESS)
+
+        for step in range(RETURN_STEPS + 1):
+            # Re-resolve each step: the arrays may have been regrown or the slot compacted
+            i = self._index.get(drone_id)
+            if i is None:
+                return  # removed mid-journey
+
+            self.lat[i] = lats[step]
+            self.lon[i] = lons[step]
+            self.alt[i] = alts[step]
+            # np.maximum keeps NaN
+            self.battery[i] = np.maximum(self.battery[i] - drain[step], 0.0)
 
             await asyncio.sleep(sleep_per_step)
 
@@ -317,21 +511,22 @@ class DroneFleetManager:
             print(f"❌ land_drone: unknown drone {drone_id}")
             return
 
-        self.drones[drone_id].update({
+        self.update_drone(drone_id, {
             'status': 'landed',
             'returning_home': False,
             'emergency_mode': False,
-            'lat': 28.7041,  # Home base coordinates
-            'lon': 77.1025,
+            'lat': HOME_LAT,
+            'lon': HOME_LON,
             'alt': 0,
             'landed_at': datetime.now().isoformat()
         })
 
         # Notify successful landing
+        battery = self._settle(self._index[drone_id])
         alert_data = {
             'type': 'drone_landed',
             'drone_id': drone_id,
-            'battery_level': self.drones[drone_id].get('battery'),
+            'battery_level': None if np.isnan(battery) else round(battery, BATTERY_DECIMALS),
             'landing_reason': self.drones[drone_id].get('rth_reason', 'manual'),
             'timestamp': datetime.now().isoformat()
         }
@@ -346,44 +541,75 @@ class DroneFleetManager:
             print(f"❌ emergency_landing_procedures: unknown drone {drone_id}")
             return
 
-        # Ensure logs directory exists
-        logs_dir = "logs"
-        try:
-            os.makedirs(logs_dir, exist_ok=True)
-        except Exception as e:
-            print(f"❌ Could not create logs directory '{logs_dir}': {e}")
-
         # Log emergency event
+        drone = self.get_drone(drone_id)
         emergency_log = {
             'drone_id': drone_id,
             'event': 'emergency_landing',
-            'battery_level': self.drones[drone_id].get('battery'),
+            'battery_level': drone.get('battery'),
             'timestamp': datetime.now().isoformat(),
             'location': {
-                'lat': self.drones[drone_id].get('lat'),
-                'lon': self.drones[drone_id].get('lon')
+                'lat': drone.get('lat'),
+                'lon': drone.get('lon')
             }
         }
 
+        if self._log_task is None or self._log_task.done():
+            self._log_task = asyncio.create_task(self._write_emergency_logs(), name="emergency-log-writer")
         try:
-            filename = os.path.join(logs_dir, f"emergency_{drone_id}_{int(time.time())}.json")
-            with open(filename, 'w') as f:
-                json.dump(emergency_log, f, indent=2)
-        except Exception as e:
-            print(f"❌ Failed to write emergency log for {drone_id}: {e}")
+            self._log_queue.put_nowait(emergency_log)
+        except asyncio.QueueFull:
+            print(f"❌ Emergency log queue full, dropping record for {drone_id}")
+
+    async def _write_emergency_logs(self):
+        """Append queued emergency records to EMERGENCY_LOG, one open per batch"""
+        while True:
+            records = [await self._log_queue.get()]
+            while not self._log_queue.empty():
+                records.append(self._log_queue.get_nowait())
+
+            try:
+                # Disk (or NFS) latency stays off the event loop and the return-journey simulations
+                await asyncio.to_thread(self._append_emergency_logs, records)
+            except Exception as e:
+                print(f"❌ Failed to write {len(records)} emergency log record(s): {e}")
+
+    async def _stop_emergency_log_writer(self):
+        """Cancel the writer task and persist whatever is still queued"""
+        if self._log_task is not None:
+            self._log_task.cancel()
+            await asyncio.wait([self._log_task], timeout=SHUTDOWN_DEADLINE)
+            self._log_task = None
+
+        records = []
+        while not self._log_queue.empty():
+            records.append(self._log_queue.get_nowait())
+        if records:
+            try:
+                await asyncio.to_thread(self._append_emergency_logs, records)
+            except Exception as e:
+                print(f"❌ Failed to write {len(records)} emergency log record(s): {e}")
+
+    def _append_emergency_logs(self, records: List[dict]):
+        """Blocking append of a batch of records to EMERGENCY_LOG (runs in a worker thread)"""
+        with open(EMERGENCY_LOG, 'a') as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
 
     def calculate_distance(self, lat1, lon1, lat2, lon2):
         """Calculate distance between two coordinates (in meters)"""
-        import math
-
         R = 6371000  # Earth's radius in meters
-        lat1_rad = math.radians(float(lat1))
-        lat2_rad = math.radians(float(lat2))
-        delta_lat = math.radians(float(lat2) - float(lat1))
-        delta_lon = math.radians(float(lon2) - float(lon1))
+        lat1_rad = math.radians(lat1)
+        if lat2 == HOME_LAT:
+            # Every RTH measures to home, whose terms are precomputed
+            lat2_rad, cos_lat2 = HOME_LAT_RAD, HOME_COS_LAT
+        else:
+            lat2_rad = math.radians(lat2)
+            cos_lat2 = math.cos(lat2_rad)
+        delta_lat = lat2_rad - lat1_rad
+        delta_lon = math.radians(lon2 - lon1)
 
         a = (math.sin(delta_lat/2) * math.sin(delta_lat/2) +
-             math.cos(lat1_rad) * math.cos(lat2_rad) *
+             math.cos(lat1_rad) * cos_lat2 *
              math.sin(delta_lon/2) * math.sin(delta_lon/2))
 
         c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
@@ -391,20 +617,43 @@ class DroneFleetManager:
 
         return distance
 
+    def calculate_distance_batch(self, lats1, lons1, lats2, lons2):
+        """Vectorized haversine over coordinate arrays (in meters); scalars broadcast"""
+        R = 6371000  # Earth's radius in meters
+        lat1_rad = np.radians(lats1)
+        if np.isscalar(lats2) and lats2 == HOME_LAT:
+            lat2_rad, cos_lat2 = HOME_LAT_RAD, HOME_COS_LAT
+        else:
+            lat2_rad = np.radians(lats2)
+            cos_lat2 = np.cos(lat2_rad)
+        delta_lat = lat2_rad - lat1_rad
+        delta_lon = np.radians(lons2) - np.radians(lons1)
+
+        a = (np.sin(delta_lat / 2) ** 2 +
+             np.cos(lat1_rad) * cos_lat2 * np.sin(delta_lon / 2) ** 2)
+
+        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+        return R * c
+
     async def notify_operators(self, alert_data: dict):
         """Notify operators about drone events"""
         try:
             print(f"📢 ALERT: {alert_data}")
 
-            # Send to all registered callbacks (assume callbacks are async)
+            # Send to all registered callbacks; async ones run concurrently
+            coros = []
             for callback in list(self.alert_callbacks):
                 try:
                     maybe_coro = callback(alert_data)
                     if asyncio.iscoroutine(maybe_coro):
-                        await maybe_coro
+                        coros.append(maybe_coro)
                     # if callback is sync, it will have already executed
                 except Exception as e:
                     print(f"❌ Alert callback error: {e}")
+
+            for result in await asyncio.gather(*coros, return_exceptions=True):
+                if isinstance(result, Exception):
+                    print(f"❌ Alert callback error: {result}")
         except Exception as e:
             print(f"❌ notify_operators error: {e}")
 
@@ -417,23 +666,105 @@ class DroneFleetManager:
         drone_id = drone_data.get('drone_id')
         if not drone_id:
             raise ValueError("drone_data must contain 'drone_id'")
-        self.drones[drone_id] = drone_data
+
+        if drone_id not in self._index:
+            self._reserve(self._count + 1)
+            self._index[drone_id] = self._count
+            self._ids.append(drone_id)
+            self._count += 1
+
+        # Re-adding a drone replaces it entirely: reset its slot before writing the new fields
+        i = self._index[drone_id]
+        for name in FLOAT_FIELDS:
+            getattr(self, name)[i] = np.nan
+        self.status[i] = self._status_code(None)
+        self.returning_home[i] = False
+        self.drones[drone_id] = {}
+        self.update_drone(drone_id, drone_data)
+
+    def remove_drone(self, drone_id: str) -> bool:
+        """Remove drone from fleet, moving the last slot into its place"""
+        # Like add_drone, no await points: slot compaction is atomic on the event loop
+        i = self._index.pop(drone_id, None)
+        if i is None:
+            return False
+
+        last = self._count - 1
+        if i != last:
+            moved = self._ids[last]
+            for name in SLOT_ARRAYS:
+                array = getattr(self, name)
+                array[i] = array[last]
+            self._ids[i] = moved
+            self._index[moved] = i
+        self._ids.pop()
+        self._count = last
+        # Its heap entries go stale since the id no longer resolves
+        del self.drones[drone_id]
+        return True
 
     def get_fleet_status(self):
         """Get current fleet status"""
+        self._settle_all()
+        n = self._count
         return {
-            'total_drones': len(self.drones),
-            'active_drones': len([d for d in self.drones.values() if d.get('status') == 'active']),
-            'returning_drones': len([d for d in self.drones.values() if d.get('returning_home', False)]),
-            'low_battery_drones': len([d for d in self.drones.values() if isinstance(d.get('battery'), (int, float)) and d.get('battery') <= self.rth_threshold]),
-            'drones': self.drones,
+            'total_drones': n,
+            'active_drones': int(np.count_nonzero(self.status[:n] == STATUS_ACTIVE)),
+            'returning_drones': int(np.count_nonzero(self.returning_home[:n])),
+            'low_battery_drones': int(np.count_nonzero(self.battery[:n] <= self.rth_threshold)),
+            'drones': {drone_id: self.get_drone(drone_id) for drone_id in self._ids},
             'monitoring': self.monitoring
         }
 
+    def as_arrays(self) -> dict:
+        """Settled copies of the hot fields (one array per field, slot order) plus their 'drone_id' list"""
+        self._settle_all()
+        n = self._count
+        arrays = {name: getattr(self, name)[:n].copy() for name in HOT_FIELDS}
+        arrays['drone_id'] = list(self._ids)
+        return arrays
+
+    def get_swarm_status(self) -> dict:
+        """Fleet counts and per-drone swarm entries, assembled column-wise from the field arrays"""
+        arrays = self.as_arrays()
+        ids = arrays['drone_id']
+
+        def column(values):
+            # Missing (NaN) fields become None in the JSON
+            boxed = values.astype(object)
+            boxed[np.isnan(values)] = None
+            return boxed.tolist()
+
+        lats, lons, alts = column(arrays['lat']), column(arrays['lon']), column(arrays['alt'])
+        batteries = column(np.round(arrays['battery'], BATTERY_DECIMALS))
+        statuses = np.array(self._status_names, dtype=object)[arrays['status']].tolist()
+        returning = arrays['returning_home'].tolist()
+        cold = [self.drones[drone_id] for drone_id in ids]
+        return {
+            'total_drones': len(ids),
+            'active_drones': int(np.count_nonzero(arrays['status'] == STATUS_ACTIVE)),
+            'detections': [
+                {
+                    'drone_id': drone_id,
+                    'lat': lat,
+                    'lon': lon,
+                    'alt': alt,
+                    'battery': battery,
+                    'status': status,
+                    'detection': fields.get('detection', 'Clear'),
+                    'confidence': fields.get('confidence', 0.0),
+                    'returning_home': returning_home,
+                    'rth_reason': fields.get('rth_reason')
+                }
+                for drone_id, lat, lon, alt, battery, status, returning_home, fields
+                in zip(ids, lats, lons, alts, batteries, statuses, returning, cold)
+            ]
+        }
+
     async def manual_rth(self, drone_id: str):
         """Manual return to home command"""
         if drone_id in self.drones:
-            await self.auto_rth(drone_id, self.drones[drone_id].get('battery', 0))
+            await self.auto_rth(drone_id, self._battery_of(drone_id))
             return True
         return False
 
@@ -441,13 +772,23 @@ class DroneFleetManager:
         """Emergency RTH for all active drones"""
         print("🚨 EMERGENCY RTH - ALL DRONES")
 
-        active_drones = [drone_id for drone_id, drone in self.drones.items()
-                         if drone.get('status') == 'active']
+        ids, status = self._snapshot()
+        self._settle_all()
+        active = np.flatnonzero(status == STATUS_ACTIVE)
+        if active.size == 0:
+            return
+
+        # Distances home for the whole fleet in one vectorized call
+        distances = self.calculate_distance_batch(
+            np.nan_to_num(self.lat[active]), np.nan_to_num(self.lon[active]),
+            HOME_LAT, HOME_LON
+        )
 
         # Launch emergency RTHs concurrently but don't block each other
         coros = []
-        for drone_id in active_drones:
-            coros.append(self.emergency_rth(drone_id, self.drones[drone_id].get('battery', 0)))
+        for i, distance in zip(active.tolist(), distances.tolist()):
+            drone_id = ids[i]
+            coros.append(self.emergency_rth(drone_id, self._battery_of(drone_id), distance))
 
         if coros:
             # run all concurrently
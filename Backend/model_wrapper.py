@@ -1,4 +1,5 @@
 import torch
+import torch.nn.functional as F
 import cv2
 import numpy as np
 from ultralytics import YOLO
@@ -6,8 +7,45 @@ from pathlib import Path
 import time
 from PIL import Image
 import asyncio
-import hashlib
+import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from cache_manager import cache_manager
+from process_lock import exclusive_file_lock
+
+logger = logging.getLogger("guardx")
+
+MODEL_STRIDE = 32
+INFER_SIZE = 640
+PRECISIONS = ('fp32', 'fp16', 'int8')
+# Largest batch the exported TensorRT engine is built for (shared with advanced_detection)
+ENGINE_BATCH = 16
+# Realtime frames arriving within this window (seconds) share one forward pass, up to REALTIME_BATCH of them
+BATCH_WINDOW = 0.005
+REALTIME_BATCH = 8
+# Result a waiting frame resolves to when a newer frame of the same stream replaces it
+FRAME_DROPPED = "dropped"
+# Ultralytics letterbox grey, as a 0-1 value for the padded part of the frame buffer
+LETTERBOX_FILL = 114 / 255
+
+def load_engine(weights, batch=ENGINE_BATCH, imgsz=INFER_SIZE):
+    """Load a cached TensorRT FP16 engine for weights, exporting it on first use"""
+    if not torch.cuda.is_available():
+        return YOLO(weights)
+
+    engine_path = Path(weights).with_suffix('.engine')
+    # Workers starting together export once; the rest wait and then load the finished file
+    with exclusive_file_lock(f"{engine_path}.lock"):
+        if not engine_path.exists():
+            try:
+                print(f"🔄 Exporting {weights} to TensorRT engine...")
+                YOLO(weights).export(format='engine', half=True, dynamic=True,
+                                     batch=batch, imgsz=imgsz, workspace=4)
+            except Exception as e:
+                print(f"⚠️ TensorRT export failed, using {weights}: {e}")
+                return YOLO(weights)
+
+    return YOLO(str(engine_path), task='detect')
 
 class ModelWrapper:
     def __init__(self):
@@ -15,25 +53,166 @@ class ModelWrapper:
         self.active_model_name = None
         self.confidence_threshold = 0.5
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        # int8 ONNX Runtime variants of self.models, built on CPU hosts only
+        self.int8_models = {}
+        # TensorRT FP16 engines of self.models, built on CUDA hosts only
+        self.engines = {}
+        # Reused host (pinned) and device buffers for realtime frames, allocated once the engine is up
+        self._pinned_frame = None
+        self._device_frame = None
+        self._frame_batch = None
+        # Recorded after each host->device staging copy; the pinned buffer is reused only once it fires
+        self._staging_done = None
+        # Realtime frames waiting for the next batched forward pass: stream key -> (frame, future).
+        # One slot per stream, so a backlog never builds up behind a slow model
+        self._pending_frames = {}
+        self._frames_ready = asyncio.Event()
+        self._batch_task = None
+        # Forward passes run here, one at a time, so the event loop keeps serving during inference
+        self._infer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="infer")
+        # fp16 uses tensor cores on GPU; on CPU the int8 model takes its place
+        self.default_precision = 'fp16' if self.device == 'cuda' else 'int8'
         
-    def _get_image_hash(self, image) -> str:
-        """Generate hash for image caching"""
+    def _get_image_hash(self, image, precision) -> str:
+        """Generate cache key for an image's pixels at a precision"""
         try:
-            img_array = np.array(image)
-            return hashlib.md5(img_array.tobytes()).hexdigest()
+            img_array = np.ascontiguousarray(image)
+            return cache_manager.content_key(memoryview(img_array), precision)
         except Exception as e:
             print(f"⚠️ Hash generation failed: {e}")
             return str(time.time())
     
+    def _prepare_tensor(self, image):
+        """Turn a CHW uint8 tensor into a stride-aligned BCHW float batch, returning (batch, x_scale, y_scale)"""
+        _, height, width = image.shape
+        scale = min(INFER_SIZE / max(height, width), 1.0)
+        new_height = max(MODEL_STRIDE, round(height * scale / MODEL_STRIDE) * MODEL_STRIDE)
+        new_width = max(MODEL_STRIDE, round(width * scale / MODEL_STRIDE) * MODEL_STRIDE)
+        
+        batch = image.unsqueeze(0).float().div_(255)
+        if (new_height, new_width) != (height, width):
+            batch = F.interpolate(batch, size=(new_height, new_width), mode='bilinear', align_corners=False)
+        return batch, width / new_width, height / new_height
+    
+    def _build_int8_model(self, weights):
+        """Export weights to ONNX and dynamically quantize them to int8 for ONNX Runtime"""
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        
+        int8_path = Path(weights).with_name(f"{Path(weights).stem}_int8.onnx")
+        with exclusive_file_lock(f"{int8_path}.lock"):
+            if not int8_path.exists():
+                onnx_path = YOLO(weights).export(format='onnx', imgsz=INFER_SIZE, dynamic=True)
+                quantize_dynamic(onnx_path, str(int8_path), weight_type=QuantType.QUInt8)
+        return YOLO(str(int8_path), task='detect')
+    
+    def resolve_precision(self, precision=None) -> str:
+        """Map a requested precision to the one this host can actually run"""
+        precision = precision or self.default_precision
+        if precision == 'int8' and self.active_model_name not in self.int8_models:
+            precision = 'fp16'
+        if precision == 'fp16' and self.device != 'cuda':
+            precision = 'fp32'
+        return precision
+    
+    def _allocate_frame_buffers(self):
+        """Allocate the pinned staging buffers and the (REALTIME_BATCH,3,640,640) device batch realtime frames go through"""
+        self._pinned_frame = torch.empty((REALTIME_BATCH, INFER_SIZE, INFER_SIZE, 3), dtype=torch.uint8).pin_memory()
+        self._device_frame = torch.empty((REALTIME_BATCH, INFER_SIZE, INFER_SIZE, 3), dtype=torch.uint8, device=self.device)
+        self._frame_batch = torch.empty((REALTIME_BATCH, 3, INFER_SIZE, INFER_SIZE), dtype=torch.float16, device=self.device)
+    
+    def _frames_to_batch(self, frames):
+        """Copy BGR frames (each at most 640x640) into the reused device batch, padding the rest.
+        Boxes come back in frame coordinates since each frame sits at the top-left corner of its slot."""
+        # The previous batch's non-blocking copies may still be reading the pinned buffer
+        if self._staging_done is not None:
+            self._staging_done.synchronize()
+        
+        batch = self._frame_batch[:len(frames)]
+        batch.fill_(LETTERBOX_FILL)
+        for slot, frame in enumerate(frames):
+            height, width = frame.shape[:2]
+            host = self._pinned_frame[slot, :height, :width]
+            host.copy_(torch.from_numpy(np.ascontiguousarray(frame)))
+            staged = self._device_frame[slot, :height, :width]
+            staged.copy_(host, non_blocking=True)
+            # HWC BGR uint8 -> CHW RGB 0-1
+            batch[slot, :, :height, :width] = staged.permute(2, 0, 1).flip(0).half().div_(255)
+        self._staging_done = torch.cuda.Event()
+        self._staging_done.record()
+        return batch
+    
+    def _detect_frame_batch(self, frames):
+        """One forward pass over a list of realtime frames, returning one result per frame"""
+        engine = self.engines.get(self.active_model_name)
+        if engine is not None and all(f.shape[0] <= INFER_SIZE and f.shape[1] <= INFER_SIZE for f in frames):
+            return engine(self._frames_to_batch(frames), conf=0.3, classes=[0])
+        return self.models[self.active_model_name](frames, conf=0.3, classes=[0])
+    
+    def _submit_frame(self, frame, stream_id=None):
+        """Put a frame in its stream's slot, dropping the one still waiting there"""
+        future = asyncio.get_running_loop().create_future()
+        # Without a stream id every frame gets its own slot
+        key = stream_id if stream_id is not None else object()
+        
+        previous = self._pending_frames.pop(key, None)
+        if previous is not None and not previous[1].done():
+            previous[1].set_result(FRAME_DROPPED)
+        self._pending_frames[key] = (frame, future)
+        self._frames_ready.set()
+        return future
+    
+    async def _collect_frame_batches(self):
+        """Group the latest frame of each stream arriving within BATCH_WINDOW into one model call"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._frames_ready.wait()
+            if len(self._pending_frames) < REALTIME_BATCH:
+                await asyncio.sleep(BATCH_WINDOW)  # let other streams join this pass
+            
+            keys = list(itertools.islice(self._pending_frames, REALTIME_BATCH))
+            pending = [self._pending_frames.pop(key) for key in keys]
+            if not self._pending_frames:
+                self._frames_ready.clear()
+            
+            try:
+                results = await loop.run_in_executor(
+                    self._infer_pool, self._detect_frame_batch, [frame for frame, _ in pending]
+                )
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), result in zip(pending, results):
+                if not future.done():
+                    future.set_result(result)
+    
+    def _extract_boxes(self, result, x_scale=1.0, y_scale=1.0):
+        """Pull (boxes, confidences) out of one result with a single device->host copy per tensor"""
+        if result is None or getattr(result, 'boxes', None) is None or len(result.boxes) == 0:
+            return [], []
+        xyxy = result.boxes.xyxy.detach().cpu().numpy()
+        if x_scale != 1.0 or y_scale != 1.0:
+            xyxy = xyxy * np.array([x_scale, y_scale, x_scale, y_scale], dtype=xyxy.dtype)
+        return xyxy.tolist(), result.boxes.conf.detach().cpu().numpy().tolist()
+    
+    def _frame_ahash(self, frame, width, height) -> str:
+        """64-bit average hash of a BGR frame, keyed with its original size"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA)
+        bits = np.packbits(small > small.mean())
+        return f"{width}x{height}-{bits.tobytes().hex()}"
+    
     async def load_models(self):
-        """Load both custom and fallback models"""
+        """Load both custom and fallback models (weights are read off the event loop)"""
         print("🔄 Loading AI models...")
         
         # Try to load custom trained model first
         custom_model_path = Path("models/best.pt")
         if custom_model_path.exists():
             try:
-                self.models['custom'] = YOLO(str(custom_model_path))
+                self.models['custom'] = await asyncio.to_thread(YOLO, str(custom_model_path))
                 self.active_model_name = 'custom'
                 print(f"✅ Custom model loaded: {custom_model_path}")
             except Exception as e:
@@ -41,19 +220,42 @@ class ModelWrapper:
         
         # Load fallback YOLO model
         try:
-            self.models['yolo'] = YOLO('yolov8n.pt')
+            self.models['yolo'] = await asyncio.to_thread(YOLO, 'yolov8n.pt')
             if not self.active_model_name:
                 self.active_model_name = 'yolo'
             print("✅ YOLO fallback model loaded")
         except Exception as e:
             print(f"❌ YOLO model failed: {e}")
+        
+        if self.device == 'cuda' and self.active_model_name:
+            torch.backends.cudnn.benchmark = True
+            weights = str(custom_model_path) if self.active_model_name == 'custom' else 'yolov8n.pt'
+            try:
+                engine = await asyncio.to_thread(load_engine, weights)
+                self._allocate_frame_buffers()
+                # Warm-up pass so the first request doesn't pay for engine/context setup
+                warmup = self._frame_batch[:1].fill_(LETTERBOX_FILL)
+                await asyncio.to_thread(engine, warmup, classes=[0], verbose=False)
+                self.engines[self.active_model_name] = engine
+                print("✅ TensorRT FP16 engine ready")
+            except Exception as e:
+                print(f"⚠️ TensorRT engine unavailable, serving PyTorch weights: {e}")
+        
+        if self.device == 'cpu' and self.active_model_name:
+            weights = str(custom_model_path) if self.active_model_name == 'custom' else 'yolov8n.pt'
+            try:
+                self.int8_models[self.active_model_name] = await asyncio.to_thread(self._build_int8_model, weights)
+                print("✅ int8 ONNX Runtime model ready")
+            except Exception as e:
+                print(f"⚠️ int8 quantization unavailable, serving fp32: {e}")
             
         print(f"🎯 Active model: {self.active_model_name}")
     
-    async def detect_humans(self, image, confidence=None):
-        """Enhanced human detection with caching"""
+    async def detect_humans(self, image, confidence=None, cache_key=None, perceptual_key=None, precision=None):
+        """Enhanced human detection with caching (accepts PIL, HWC ndarray or CHW uint8 tensor).
+        A caller passing cache_key has already probed the cache with it (and with perceptual_key)."""
         try:
-            print(f"🔄 Starting detection with model: {self.active_model_name}")
+            logger.debug("🔄 Starting detection with model: %s", self.active_model_name)
             
             if not self.models:
                 raise Exception("No models loaded")
@@ -62,39 +264,44 @@ class ModelWrapper:
                 raise Exception(f"Active model {self.active_model_name} not available")
             
             conf = confidence or self.confidence_threshold
+            precision = self.resolve_precision(precision)
             
-            # Generate image hash for caching
-            image_hash = self._get_image_hash(image)
-            
-            # Check cache first
-            cached_result = cache_manager.get_detection(image_hash, conf)
-            if cached_result:
-                return cached_result
+            if cache_key:
+                image_hash = cache_key
+            else:
+                # Generate image hash for caching
+                image_hash = self._get_image_hash(image, precision)
+                
+                # Check cache first
+                cached_result = cache_manager.get_detection(image_hash, conf)
+                if cached_result:
+                    return cached_result
             
-            model = self.models[self.active_model_name]
+            if precision == 'int8':
+                model = self.int8_models[self.active_model_name]
+            elif precision == 'fp16' and self.active_model_name in self.engines:
+                model = self.engines[self.active_model_name]
+            else:
+                model = self.models[self.active_model_name]
             start_time = time.time()
             
-            # Convert PIL to numpy array
-            img_array = np.array(image)
+            if isinstance(image, torch.Tensor):
+                # Already decoded on the device; resize there and map boxes back per axis
+                height, width = image.shape[-2:]
+                model_input, x_scale, y_scale = self._prepare_tensor(image)
+            else:
+                # Convert PIL to numpy array (decoded arrays pass through without a copy)
+                model_input, x_scale, y_scale = np.asarray(image), 1.0, 1.0
+                height, width = model_input.shape[:2]
             
-            # Run detection
-            results = model(img_array, conf=conf, classes=[0])
+            # Run detection on the inference thread so the event loop keeps serving
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._infer_pool, lambda: model(model_input, conf=conf, classes=[0], half=precision == 'fp16')
+            )
             processing_time = time.time() - start_time
             
             # Extract results
-            boxes = []
-            confidences = []
-            
-            if results and len(results) > 0:
-                result = results[0]
-                if hasattr(result, 'boxes') and result.boxes is not None:
-                    for box in result.boxes:
-                        if hasattr(box, 'xyxy') and hasattr(box, 'conf'):
-                            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                            confidence_score = float(box.conf[0].cpu().numpy())
-                            
-                            boxes.append([float(x1), float(y1), float(x2), float(y2)])
-                            confidences.append(confidence_score)
+            boxes, confidences = self._extract_boxes(results[0] if results else None, x_scale, y_scale)
             
             detection_result = {
                 "boxes": boxes,
@@ -102,11 +309,14 @@ class ModelWrapper:
                 "confidences": confidences,
                 "model_type": self.active_model_name,
                 "processing_time": round(processing_time, 3),
-                "confidence_threshold": conf
+                "confidence_threshold": conf,
+                "precision": precision,
+                "image_size": {"width": int(width), "height": int(height)}
             }
             
             # Cache the result
-            cache_manager.set_detection(image_hash, conf, detection_result)
+            cache_manager.set_detection(image_hash, conf, detection_result, perceptual_hash=perceptual_key)
+            await cache_manager.share_detection(image_hash, conf, detection_result, perceptual_hash=perceptual_key)
             
             return detection_result
             
@@ -123,53 +333,42 @@ class ModelWrapper:
                 "error": str(e)
             }
     
-    async def detect_realtime_frame(self, frame):
-        """Optimized detection with frame caching"""
+    async def detect_realtime_frame(self, frame, stream_id=None):
+        """Optimized detection with frame caching. Frames of one stream_id that arrive while
+        an earlier one is still waiting replace it; the earlier call returns with dropped=True."""
         try:
             if not self.models or self.active_model_name not in self.models:
                 return {"boxes": [], "count": 0, "confidences": []}
             
-            # Generate frame hash
-            frame_hash = hashlib.md5(frame.tobytes()).hexdigest()
+            # Downscale so the longer side fits 640, snapped to the model stride so YOLO needn't pad again;
+            # frames that already fit are used as-is (the engine buffer / letterbox pads them)
+            height, width = frame.shape[:2]
+            scale = INFER_SIZE / max(height, width)
+            if scale < 1.0:
+                new_width = max(MODEL_STRIDE, int(width * scale) // MODEL_STRIDE * MODEL_STRIDE)
+                new_height = max(MODEL_STRIDE, int(height * scale) // MODEL_STRIDE * MODEL_STRIDE)
+                frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+            else:
+                new_width, new_height = width, height
+            
+            # Approximate key: near-identical frames of a static scene share it (see frame_ttl)
+            frame_hash = self._frame_ahash(frame, width, height)
             
             # Check cache
             cached_result = cache_manager.get_frame_detection(frame_hash)
             if cached_result:
                 return cached_result
             
-            model = self.models[self.active_model_name]
+            # Run detection batched with whatever other streams sent in the same window
+            if self._batch_task is None or self._batch_task.done():
+                self._batch_task = asyncio.create_task(self._collect_frame_batches(), name="frame-batcher")
             
-            # Resize for performance
-            height, width = frame.shape[:2]
-            if width > 640:
-                scale_factor = 640 / width
-                new_width = 640
-                new_height = int(height * scale_factor)
-                frame = cv2.resize(frame, (new_width, new_height))
-            else:
-                scale_factor = 1.0
-            
-            # Run detection
-            results = model(frame, conf=0.3, classes=[0])
-            
-            boxes = []
-            confidences = []
-            
-            if results and len(results) > 0:
-                result = results[0]
-                if hasattr(result, 'boxes') and result.boxes is not None:
-                    for box in result.boxes:
-                        if hasattr(box, 'xyxy') and hasattr(box, 'conf'):
-                            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                            confidence_score = float(box.conf[0].cpu().numpy())
-                            
-                            # Scale back to original size
-                            if scale_factor != 1.0:
-                                x1, x2 = x1 / scale_factor, x2 / scale_factor
-                                y1, y2 = y1 / scale_factor, y2 / scale_factor
-                            
-                            boxes.append([float(x1), float(y1), float(x2), float(y2)])
-                            confidences.append(confidence_score)
+            result = await self._submit_frame(frame, stream_id)
+            if result is FRAME_DROPPED:
+                return {"boxes": [], "count": 0, "confidences": [], "dropped": True}
+            
+            # Scale back to original size (per axis, since snapping changes the aspect ratio slightly)
+            boxes, confidences = self._extract_boxes(result, width / new_width, height / new_height)
             
             result = {
                 "boxes": boxes,
@@ -0,0 +1,37 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: single-process development only, so locks are no-ops
+
+# Lock files stay open for the life of the process; closing one would release it
+_held_locks = []
+
+@contextmanager
+def exclusive_file_lock(path):
+    """Block until this process holds an exclusive lock on path (for one-off work like model exports)"""
+    with open(path, 'a') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+def claim_process_lock(path) -> bool:
+    """Try to become the one worker holding path; True if this process now owns it until exit"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handle = open(path, 'a')
+    if fcntl is not None:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+    _held_locks.append(handle)
+    return True
@@ -32,13 +32,25 @@ def main():
     print(" Health Check: http://localhost:8000/api/health")
     print("\n" + "=" * 50)
     
+    # uvicorn creates the event loop in each worker, so uvloop is selected here rather than via a policy.
+    # Production serves with httptools (one worker unless WEB_CONCURRENCY says otherwise); development keeps
+    # the reloader and uvicorn's "auto" loop, which is uvloop wherever it is installed
+    if os.getenv("GUARDX_ENV", "development") == "production":
+        server_options = {
+            "loop": "uvloop",
+            "http": "httptools",
+            "workers": int(os.getenv("WEB_CONCURRENCY", 1))
+        }
+    else:
+        server_options = {"reload": True}
+    
     # Start server
     uvicorn.run(
         "app:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
-        log_level="info"
+        log_level="info",
+        **server_options
     )
 
 if __name__ == "__main__":